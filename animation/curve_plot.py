@@ -8,7 +8,7 @@ Description: add the plot tool to show the speed curve or acceleration curve
 '''
 
 import matplotlib.pyplot as plt
-import pandas as pd
+from animation.record_solution import DataRecorder
 import os
 
 class CurvePloter:
@@ -23,14 +23,15 @@ class CurvePloter:
         plt_item = ['v','a','sigma','omega']
         opt_data_path = os.path.join(data_save_path, data_save_name)
         preopt_data_path = os.path.join(data_save_path + '_preopt', data_save_name)
-        opt_data = pd.read_csv(opt_data_path, sep='\t')
-        preopt_data = pd.read_csv(preopt_data_path, sep='\t')
-        t = opt_data.loc[:,'t'].to_numpy()
+        # the .npy solution is memory mapped, only the plotted columns are read
+        opt_data = DataRecorder.load(opt_data_path)
+        preopt_data = DataRecorder.load(preopt_data_path)
+        t = opt_data['t']
 
         for i in range(len(plt_item)):
             plt.figure(fig_id + i)
-            y_opt = opt_data.loc[:, [plt_item[i]]].to_numpy()
-            y_preopt = preopt_data.loc[:, [plt_item[i]]].to_numpy()
+            y_opt = opt_data[plt_item[i]]
+            y_preopt = preopt_data[plt_item[i]]
             plt.plot(t, y_opt, 'b-')
             plt.plot(t, y_preopt, 'r-')
             plt.legend(['opt','pre_opt'])
@@ -4,51 +4,126 @@ Date: 2022-11-02
 LastEditors: wenqing-hnu
 LastEditTime: 2022-11-06
 FilePath: /Automated Valet Parking/animation/record_solution.py
-Description: record the trajectory into a csv file
+Description: record the trajectory into a csv file or a binary .npy file
 
 Copyright (c) 2022 by wenqing-hnu, All Rights Reserved. 
 '''
 
 
-from typing import List
+from util_math.trajectory import Trajectory, TRAJECTORY_COLUMNS, as_trajectory
+from typing import Dict
+import hashlib
+import json
+import numpy as np
 import pandas as pd
 import os
 
 
+# the schema of the binary solution, the .npy file stores the float64 array
+# of the trajectory and the .json file with the same name stores the metadata
+SOLUTION_SCHEMA = 'trajectory'
+SOLUTION_VERSION = 1
+SOLUTION_DTYPE = '<f8'
+
+
 class DataRecorder:
     def __init__(self) -> None:
         pass
 
+    @staticmethod
+    def solution_name(save_name: str, file_format: str = 'csv') -> str:
+        '''
+        description: the file name of the solution of the case
+        param {str} save_name: the case file name, e.g. Case1.csv
+        param {str} file_format: 'csv' or 'npy'
+        return {str} e.g. Solution_Case1.csv or Solution_Case1.npy
+        '''
+        if file_format == 'csv':
+            return 'Solution_' + save_name
+        elif file_format == 'npy':
+            return 'Solution_' + os.path.splitext(save_name)[0] + '.npy'
+        else:
+            raise Exception("the solution format is not defined")
+
+    @staticmethod
+    def config_hash(config: dict) -> str:
+        '''
+        return the md5 of the config, the solutions of the same config have the same hash
+        '''
+        text = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.md5(text.encode()).hexdigest()
+
     @staticmethod
     def record(save_path: str,
                save_name: str,
-               trajectory: List[List]):
+               trajectory: Trajectory,
+               file_format: str = 'csv',
+               metadata: Dict = None) -> str:
         '''
-        description: save the traj into a csv file in the solution folder and
-                     the sep is '\t'.
+        description: save the traj into the solution folder, 'csv' is a csv
+                     file and the sep is '\t', 'npy' is a .npy file of the
+                     float64 (N, 8) array and a .json file of the metadata
         param {str} save_path
         param {str} case_name
-        param {List} trajectory: x,y,theta,v,a,sigma,omega,t
-        return {*}
-        '''
-
-        assert len(trajectory[0]) == 8, 'the trajectory size should be 8'
-        trajectory_data = pd.DataFrame(trajectory)
-        column_name = ['x',
-                       'y',
-                       'theta',
-                       'v',
-                       'a',
-                       'sigma',
-                       'omega',
-                       't']
-        trajectory_data.columns = column_name
+        param {Trajectory} trajectory: x,y,theta,v,a,sigma,omega,t
+        param {str} file_format: 'csv' or 'npy'
+        param {Dict} metadata: stored in the .json file, e.g. case, config_hash, stage_timings
+        return {str} the file name
+        '''
+
+        trajectory = as_trajectory(trajectory)
+        assert trajectory.columns == TRAJECTORY_COLUMNS, 'the trajectory size should be 8'
         if not os.path.exists(save_path):
             os.makedirs(save_path)
 
-        save_name = 'Solution_' + save_name
-        file_name = os.path.join(save_path, save_name)
-        trajectory_data.to_csv(file_name, index='True', sep='\t')
+        file_name = os.path.join(save_path, DataRecorder.solution_name(save_name, file_format))
+        if file_format == 'npy':
+            np.save(file_name, trajectory.data.astype(SOLUTION_DTYPE, copy=False))
+            info = {'schema': SOLUTION_SCHEMA,
+                    'version': SOLUTION_VERSION,
+                    'columns': list(TRAJECTORY_COLUMNS),
+                    'dtype': SOLUTION_DTYPE,
+                    'points': len(trajectory)}
+            info.update(metadata or {})
+            with open(os.path.splitext(file_name)[0] + '.json', 'w', encoding='utf-8') as f:
+                json.dump(info, f, indent=2, default=float)
+        else:
+            trajectory_data = pd.DataFrame(trajectory.data,
+                                           columns=list(trajectory.columns))
+            trajectory_data.to_csv(file_name, index='True', sep='\t')
+        return file_name
+
+    @staticmethod
+    def load_metadata(file_name: str) -> Dict:
+        '''
+        return the metadata of the .npy solution, None if there is no .json file
+        '''
+        info_file = os.path.splitext(file_name)[0] + '.json'
+        if not os.path.exists(info_file):
+            return None
+        with open(info_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def load(file_name: str) -> Trajectory:
+        '''
+        description: read the solution saved by record, the .npy file is
+                     memory mapped and is read only
+        param {str} file_name: the .npy or .csv solution file
+        return {Trajectory} x,y,theta,v,a,sigma,omega,t
+        '''
+        if file_name.endswith('.npy'):
+            info = DataRecorder.load_metadata(file_name)
+            if info is not None and (info.get('schema') != SOLUTION_SCHEMA or
+                                     info.get('columns') != list(TRAJECTORY_COLUMNS)):
+                raise Exception("the schema of " + file_name + " is not defined")
+            data = np.load(file_name, mmap_mode='r')
+            if data.dtype != np.dtype(SOLUTION_DTYPE):
+                raise Exception("the dtype of " + file_name + " is not defined")
+            return Trajectory(data)
+
+        trajectory_data = pd.read_csv(file_name, sep='\t')
+        return Trajectory(trajectory_data.loc[:, list(TRAJECTORY_COLUMNS)].to_numpy())
 
     @staticmethod
     def save_gif():
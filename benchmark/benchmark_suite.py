@@ -0,0 +1,334 @@
+'''
+FilePath: /Automated Valet Parking/benchmark/benchmark_suite.py
+Description: run the pipeline stages on the benchmark cases, record the
+             latency and the memory high-water mark of each stage and
+             compare them with a stored baseline file
+
+usage: python -m benchmark.benchmark_suite --cases Case1 Case2 --repeat 3
+       python -m benchmark.benchmark_suite --save_baseline
+'''
+
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from config import read_config
+from map import costmap
+from path_plan import path_planner, rs_curve
+from path_plan.compute_h import Dijkstra
+from collision_check import collision_check
+from optimization import path_optimazition
+from interpolation import path_interpolation
+from velocity_plan import velocity_planner
+
+STAGES = ['costmap', 'heuristic', 'search', 'collision',
+          'rs', 'qp', 'ocp']
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                'baseline.json')
+
+
+class StageContext:
+    '''
+    store the objects shared by the stages of one case, the expensive
+    inputs (planned path, interpolated path) are computed only once
+    '''
+
+    def __init__(self, case_file: str, config: dict, seed: int) -> None:
+        self.case_file = case_file
+        self.config = config
+        self.seed = seed
+        self.vehicle = costmap.Vehicle()
+        self.park_map = costmap.Map(file=case_file,
+                                    discrete_size=config['map_discrete_size'],
+                                    cache_path=config.get('case_cache_path', None) if config.get('case_cache', False) else None)
+        self._split_path = None
+        self._insert_path = None
+
+    def random_poses(self, num: int) -> np.array:
+        '''
+        sample poses uniformly in the map with a fixed seed
+        return: [[x,y,theta],...]
+        '''
+        rng = np.random.default_rng(self.seed)
+        boundary = self.park_map.boundary
+        x = rng.uniform(boundary[0], boundary[1], num)
+        y = rng.uniform(boundary[2], boundary[3], num)
+        theta = rng.uniform(-np.pi, np.pi, num)
+        return np.vstack((x, y, theta)).transpose()
+
+    def split_path(self) -> List[List[List]]:
+        if self._split_path is None:
+            planner = path_planner.PathPlanner(config=self.config,
+                                               map=self.park_map,
+                                               vehicle=self.vehicle)
+            _, _, self._split_path = planner.path_planning()
+        return self._split_path
+
+    def insert_path(self) -> List[List[List]]:
+        if self._insert_path is None:
+            path_optimizer = path_optimazition.path_opti(
+                self.park_map, self.vehicle, self.config)
+            interplotor = path_interpolation.interpolation(
+                config=self.config, map=self.park_map, vehicle=self.vehicle)
+            v_planner = velocity_planner.VelocityPlanner(
+                vehicle=self.vehicle,
+                velocity_func_type=self.config['velocity_func_type'])
+            self._insert_path = []
+            for path_i in self.split_path():
+                opti_path, forward = path_optimizer.get_result(path_i)
+                arc_length, path_i_info = interplotor.cubic_fitting(opti_path)
+                v_acc_func, terminate_t = v_planner.solve_nlp(
+                    arc_length=arc_length)
+                insert_path = interplotor.cubic_interpolation(
+                    path=opti_path, path_i_info=path_i_info, v_a_func=v_acc_func,
+                    forward=forward, terminate_t=terminate_t, path_arc_length=arc_length,
+                    s_func=v_planner.v_func.s_func)
+                self._insert_path.append(insert_path)
+        return self._insert_path
+
+
+def make_stage(name: str, ctx: StageContext, sample_num: int) -> Callable:
+    '''
+    return a function which prepares the inputs of this stage and returns
+    the callable to be timed
+    '''
+    config = ctx.config
+
+    if name == 'costmap':
+        def setup():
+            return lambda: costmap.Map(file=ctx.case_file,
+                                       discrete_size=config['map_discrete_size'])
+
+    elif name == 'heuristic':
+        def setup():
+            heuristic = Dijkstra(ctx.park_map)
+            return lambda: heuristic.compute_path(node_x=ctx.park_map.case.x0,
+                                                  node_y=ctx.park_map.case.y0)
+
+    elif name == 'search':
+        def setup():
+            planner = path_planner.PathPlanner(config=config,
+                                               map=ctx.park_map,
+                                               vehicle=ctx.vehicle)
+            return planner.path_planning
+
+    elif name == 'collision':
+        poses = ctx.random_poses(sample_num)
+
+        def setup():
+            if config['collision_check'] == 'circle':
+                checker = collision_check.two_circle_checker(
+                    map=ctx.park_map, vehicle=ctx.vehicle, config=config)
+            else:
+                checker = collision_check.distance_checker(
+                    map=ctx.park_map, vehicle=ctx.vehicle, config=config)
+
+            def run():
+                for x, y, theta in poses:
+                    checker.check(node_x=x, node_y=y, theta=theta)
+            return run
+
+    elif name == 'rs':
+        poses = ctx.random_poses(sample_num)
+        case = ctx.park_map.case
+        max_c = 1 / ctx.vehicle.min_radius_turn
+
+        def setup():
+            def run():
+                for x, y, theta in poses:
+                    rs_curve.calc_optimal_path(sx=x, sy=y, syaw=theta,
+                                               gx=case.xf, gy=case.yf,
+                                               gyaw=case.thetaf, maxc=max_c)
+            return run
+
+    elif name == 'qp':
+        split_path = ctx.split_path()
+
+        def setup():
+            path_optimizer = path_optimazition.path_opti(
+                ctx.park_map, ctx.vehicle, config)
+
+            def run():
+                for path_i in split_path:
+                    path_optimizer.get_result(path_i)
+            return run
+
+    elif name == 'ocp':
+        from optimization import ocp_optimization
+        insert_path = ctx.insert_path()
+
+        def setup():
+            ocp_planner = ocp_optimization.ocp_optimization(
+                park_map=ctx.park_map, vehicle=ctx.vehicle, config=config)
+
+            def run():
+                for path_i in insert_path:
+                    ocp_planner.solution(path=path_i)
+            return run
+
+    else:
+        raise Exception('unknown benchmark stage: ' + name)
+
+    return setup
+
+
+def measure(setup: Callable, repeat: int, memory: bool) -> Dict:
+    '''
+    run the stage several times and return the latency statistics,
+    the memory peak is measured in an extra run because tracemalloc
+    slows down the execution
+    '''
+    latency = []
+    for _ in range(repeat):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        latency.append(time.perf_counter() - start)
+
+    result = {'median': float(np.median(latency)),
+              'p95': float(np.percentile(latency, 95)),
+              'repeat': repeat}
+
+    if memory:
+        run = setup()
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_memory'] = peak / 1024 / 1024  # MB
+
+    return result
+
+
+def run_suite(cases: List[str], stages: List[str], config: dict,
+              repeat: int, seed: int, sample_num: int, memory: bool) -> Dict:
+    records = dict()
+    for case_name in cases:
+        case_file = os.path.join(config['Benchmark_path'], case_name + '.csv')
+        records[case_name] = dict()
+        ctx = None
+        for stage in stages:
+            # the planner prints its search process, keep the report clean
+            with contextlib.redirect_stdout(io.StringIO()):
+                if ctx is None:
+                    ctx = StageContext(case_file=case_file,
+                                       config=config, seed=seed)
+                try:
+                    setup = make_stage(stage, ctx, sample_num)
+                    records[case_name][stage] = measure(setup, repeat, memory)
+                except Exception as error:
+                    # e.g. the ipopt executable is not found
+                    records[case_name][stage] = {'error': repr(error)}
+            print(case_name, stage, records[case_name][stage])
+    return records
+
+
+def failures(records: Dict) -> List[str]:
+    '''
+    return the stages which raised an exception
+    '''
+    return ['%s %s failed: %s' % (case_name, stage, result['error'])
+            for case_name, case_record in records.items()
+            for stage, result in case_record.items() if 'error' in result]
+
+
+def compare(records: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    '''
+    return the regressions: the stage failed, or the median latency or
+    the memory peak is larger than (1 + tolerance) times the baseline value
+    '''
+    regressions = failures(records)
+    for case_name, case_record in records.items():
+        for stage, result in case_record.items():
+            base = baseline.get(case_name, {}).get(stage)
+            if base is None or 'error' in base or 'error' in result:
+                continue
+            for key in ['median', 'peak_memory']:
+                if key not in base or key not in result:
+                    continue
+                if result[key] > base[key] * (1 + tolerance):
+                    regressions.append('%s %s %s: %.4f > %.4f (baseline) * %.2f'
+                                       % (case_name, stage, key, result[key],
+                                          base[key], 1 + tolerance))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark suite')
+    parser.add_argument("--config_name", type=str, default="config")
+    parser.add_argument("--cases", type=str, nargs='+', default=None,
+                        help='default: all cases in the benchmark folder')
+    parser.add_argument("--stages", type=str, nargs='+', default=STAGES,
+                        choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample_num", type=int, default=200,
+                        help='poses used by the collision and rs stages')
+    parser.add_argument("--no_memory", action='store_true')
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save_baseline", action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument("--output", type=str, default=None,
+                        help='save the results into a json file')
+    args = parser.parse_args()
+
+    config = read_config.read_config(config_name=args.config_name)
+    cases = args.cases
+    if cases is None:
+        cases = sorted([f[:-4] for f in os.listdir(config['Benchmark_path'])
+                        if f.endswith('.csv')],
+                       key=lambda name: int(name[4:]))
+
+    records = run_suite(cases=cases, stages=args.stages, config=config,
+                        repeat=args.repeat, seed=args.seed,
+                        sample_num=args.sample_num, memory=not args.no_memory)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+
+    if args.save_baseline:
+        baseline = dict()
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        # the failed stages keep their previous baseline
+        for case_name, case_record in records.items():
+            baseline.setdefault(case_name, dict()).update(
+                {stage: result for stage, result in case_record.items()
+                 if 'error' not in result})
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print('baseline saved:', args.baseline)
+        if len(failures(records)) > 0:
+            print('failed stages, not saved:')
+            for r in failures(records):
+                print('  ' + r)
+            sys.exit(1)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(records, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print('performance regressions:')
+            for r in regressions:
+                print('  ' + r)
+            sys.exit(1)
+        print('no performance regression')
+    else:
+        print('no baseline file found:', args.baseline)
+        if len(failures(records)) > 0:
+            print('failed stages:')
+            for r in failures(records):
+                print('  ' + r)
+            sys.exit(1)
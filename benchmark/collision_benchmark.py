@@ -0,0 +1,165 @@
+'''
+FilePath: /Automated Valet Parking/benchmark/collision_benchmark.py
+Description: micro benchmark of the collision checkers, it reports the
+             checks per second and the false positive/negative rates
+             against a polygon-exact reference for each map and resolution
+
+usage: python -m benchmark.collision_benchmark --cases Case1 Case5 --resolutions 0.05 0.1 0.2
+'''
+
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import shapely.geometry
+import shapely.ops
+from shapely.prepared import prep
+
+from config import read_config
+from map import costmap
+from collision_check import collision_check
+
+CHECKERS = {'circle': collision_check.two_circle_checker,
+            'distance': collision_check.distance_checker}
+
+
+def sample_poses(park_map: costmap.Map, num: int, near_dis: float,
+                 rng: np.random.Generator) -> Dict[str, np.array]:
+    '''
+    sample the poses uniformly in the map (free) and around the obstacle
+    vertexes within near_dis (near), the near poses are the hard cases.
+    the near poses outside the map boundary are sampled again, the cost map
+    has no obstacle cells there, so they are not comparable with the reference
+    return: {'free': [[x,y,theta],...], 'near': [[x,y,theta],...]}
+    '''
+    boundary = park_map.boundary
+    free = np.vstack((rng.uniform(boundary[0], boundary[1], num),
+                      rng.uniform(boundary[2], boundary[3], num),
+                      rng.uniform(-np.pi, np.pi, num))).transpose()
+
+    vertexes = np.vstack(park_map.case.obs)
+    near = np.zeros((0, 3))
+    while len(near) < num:
+        anchor = vertexes[rng.integers(0, len(vertexes), num)]
+        angle = rng.uniform(-np.pi, np.pi, num)
+        dis = rng.uniform(0, near_dis, num)
+        poses = np.vstack((anchor[:, 0] + dis * np.cos(angle),
+                           anchor[:, 1] + dis * np.sin(angle),
+                           rng.uniform(-np.pi, np.pi, num))).transpose()
+        inside = (poses[:, 0] >= boundary[0]) & (poses[:, 0] <= boundary[1]) & \
+            (poses[:, 1] >= boundary[2]) & (poses[:, 1] <= boundary[3])
+        near = np.vstack((near, poses[inside]))
+
+    return {'free': free, 'near': near[:num]}
+
+
+def reference_check(park_map: costmap.Map, vehicle: costmap.Vehicle,
+                    config: dict, poses: np.array) -> np.array:
+    '''
+    polygon-exact collision check, the vehicle box is expanded by the same
+    safe distances as the distance checker
+    '''
+    obstacles = shapely.ops.unary_union(
+        [shapely.geometry.Polygon(obs) for obs in park_map.case.obs])
+    obstacles = prep(obstacles)
+    result = []
+    for x, y, theta in poses:
+        boundary = vehicle.create_anticlockpoint(x=x, y=y, theta=theta,
+                                                 config=config).reshape(5, 2)
+        result.append(obstacles.intersects(shapely.geometry.Polygon(boundary)))
+    return np.array(result, dtype=bool)
+
+
+def benchmark_map(case_file: str, resolution: float, config: dict,
+                  sample_num: int, near_dis: float, seed: int) -> Dict:
+    vehicle = costmap.Vehicle()
+    park_map = costmap.Map(file=case_file, discrete_size=resolution)
+    rng = np.random.default_rng(seed)
+    poses = sample_poses(park_map, sample_num, near_dis, rng)
+
+    record = {'resolution': resolution,
+              'grid_cells': int(park_map.cost_map.size),
+              'obstacle_cells': int(np.sum(park_map.cost_map == 255)),
+              'map_area': float((park_map.boundary[1] - park_map.boundary[0]) *
+                                (park_map.boundary[3] - park_map.boundary[2]))}
+
+    for checker_name, checker_class in CHECKERS.items():
+        checker = checker_class(map=park_map, vehicle=vehicle, config=config)
+        record[checker_name] = dict()
+        for pose_type, pose_list in poses.items():
+            reference = reference_check(park_map, vehicle, config, pose_list)
+            start = time.perf_counter()
+            collision = np.array([checker.check(node_x=x, node_y=y, theta=theta)
+                                  for x, y, theta in pose_list], dtype=bool)
+            elapsed = time.perf_counter() - start
+
+            # false positive: the checker reports a collision in free space
+            false_positive = np.sum(collision & ~reference)
+            false_negative = np.sum(~collision & reference)
+            record[checker_name][pose_type] = {
+                'checks_per_second': len(pose_list) / elapsed,
+                'collision_rate': float(np.mean(reference)),
+                'false_positive_rate': float(false_positive / max(np.sum(~reference), 1)),
+                'false_negative_rate': float(false_negative / max(np.sum(reference), 1))}
+
+    return record
+
+
+def print_report(records: Dict[str, List[Dict]]):
+    head = '%-8s %6s %9s %9s %-9s %-5s %12s %8s %8s' % (
+        'case', 'res', 'cells', 'obs', 'checker', 'poses', 'checks/s', 'FP', 'FN')
+    print(head)
+    print('-' * len(head))
+    for case_name, case_records in records.items():
+        for record in case_records:
+            for checker_name in CHECKERS:
+                for pose_type, result in record[checker_name].items():
+                    print('%-8s %6.3f %9d %9d %-9s %-5s %12.1f %8.3f %8.3f' % (
+                        case_name, record['resolution'], record['grid_cells'],
+                        record['obstacle_cells'], checker_name, pose_type,
+                        result['checks_per_second'], result['false_positive_rate'],
+                        result['false_negative_rate']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='collision checker benchmark')
+    parser.add_argument("--config_name", type=str, default="config")
+    parser.add_argument("--cases", type=str, nargs='+', default=None,
+                        help='default: all cases in the benchmark folder')
+    parser.add_argument("--resolutions", type=float, nargs='+', default=None,
+                        help='default: map_discrete_size in the config')
+    parser.add_argument("--sample_num", type=int, default=200)
+    parser.add_argument("--near_dis", type=float, default=3.0,
+                        help='max distance from the near poses to the obstacles')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None,
+                        help='save the results into a json file')
+    args = parser.parse_args()
+
+    config = read_config.read_config(config_name=args.config_name)
+    cases = args.cases
+    if cases is None:
+        cases = sorted([f[:-4] for f in os.listdir(config['Benchmark_path'])
+                        if f.endswith('.csv')],
+                       key=lambda name: int(name[4:]))
+    resolutions = args.resolutions
+    if resolutions is None:
+        resolutions = [config['map_discrete_size']]
+
+    records = dict()
+    for case_name in cases:
+        case_file = os.path.join(config['Benchmark_path'], case_name + '.csv')
+        records[case_name] = [benchmark_map(case_file=case_file, resolution=r,
+                                            config=config, sample_num=args.sample_num,
+                                            near_dis=args.near_dis, seed=args.seed)
+                              for r in resolutions]
+
+    print_report(records)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
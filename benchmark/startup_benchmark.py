@@ -0,0 +1,72 @@
+'''
+FilePath: /Automated Valet Parking/benchmark/startup_benchmark.py
+Description: measure the cold import time of the planning modules in a fresh
+             interpreter and make sure the heavy optional dependencies
+             (matplotlib, shapely, cvxopt, pyomo) are not imported
+
+usage: python -m benchmark.startup_benchmark --repeat 10 --max_time 1.0
+'''
+
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MODULES = ['path_plan.path_planner', 'pipeline.parking_pipeline']
+HEAVY_MODULES = ['matplotlib', 'shapely', 'cvxopt', 'pyomo', 'pandas']
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed,
+                  'modules': sorted(set(m.split('.')[0] for m in sys.modules))}}))
+'''
+
+
+def measure_import(module: str, repeat: int):
+    '''
+    import the module in a fresh interpreter several times
+    return: the import times, the top level modules loaded by the import
+    '''
+    times = []
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(module=module)],
+                                cwd=ROOT_PATH, capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        times.append(result['time'])
+        loaded = result['modules']
+    return times, loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='startup time benchmark')
+    parser.add_argument("--modules", type=str, nargs='+', default=MODULES)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--max_time", type=float, default=None,
+                        help='fail if the median import time (s) is larger')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        times, loaded = measure_import(module, args.repeat)
+        heavy = [m for m in HEAVY_MODULES if m in loaded]
+        median = float(np.median(times))
+        print('%-28s median %.3f s  p95 %.3f s  heavy modules: %s'
+              % (module, median, float(np.percentile(times, 95)),
+                 ', '.join(heavy) if len(heavy) > 0 else 'none'))
+        if len(heavy) > 0:
+            failed = True
+        if args.max_time is not None and median > args.max_time:
+            print('  import time is larger than %.3f s' % args.max_time)
+            failed = True
+
+    if failed:
+        sys.exit(1)
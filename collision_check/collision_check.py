@@ -13,8 +13,8 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 from abc import abstractmethod
 from typing import Tuple
 import numpy as np
-import matplotlib.pyplot as plt
 from map.costmap import Map, Vehicle
+from instrumentation.profiler import profiler
 
 
 class collision_checker:
@@ -86,6 +86,7 @@ class two_circle_checker(collision_checker):
         super().__init__(map, vehicle, config)
 
     def check(self, node_x, node_y, theta) -> bool:
+        profiler.count('collision_checks')
         v = self.vehicle
 
         # compute circle diameter
@@ -145,6 +146,8 @@ class distance_checker(collision_checker):
         '''
         caculate the distance between obstacle point and vehicle boundary
         '''
+        profiler.count('collision_checks')
+
         # compute the boundary straight line
         def compute_k_b(point_1, point_2):
             # k = (y_2 - y_1) / (x_2 - x_1)
@@ -0,0 +1,112 @@
+'''
+FilePath: /Automated Valet Parking/instrumentation/profiler.py
+Description: lightweight timers and counters for the planning pipeline
+'''
+
+
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class Profiler:
+    '''
+    collect the wall time of each pipeline stage and the counters of the
+    expensive inner calls, e.g. node expansions, collision checks,
+    heuristic calls, rs curve calls and solver iterations.
+    all modules share the instance `profiler` defined in this file
+    '''
+
+    def __init__(self) -> None:
+        self.timings = dict()  # stage name -> accumulated wall time (s)
+        self.calls = dict()  # stage name -> number of timed calls
+        self.counters = dict()  # counter name -> value
+
+    def reset(self):
+        self.timings = dict()
+        self.calls = dict()
+        self.counters = dict()
+
+    @contextmanager
+    def timer(self, name: str):
+        '''
+        description: accumulate the wall time of the code in the with block
+        param {str} name: stage name, e.g. 'path_planning'
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, record: Dict):
+        '''
+        description: add the timings and counters of another profiler,
+        e.g. the record of a worker process
+        param {Dict} record: see Profiler.record
+        '''
+        for name, value in record['timings'].items():
+            self.timings[name] = self.timings.get(name, 0.0) + value
+        for name, value in record['calls'].items():
+            self.calls[name] = self.calls.get(name, 0) + value
+        for name, value in record['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, case_name: str = None, **extra) -> Dict:
+        '''
+        description: build the record of the current case
+        param {str} case_name
+        param extra: other values to store, e.g. the trajectory time
+        return {Dict} the json serializable record
+        '''
+        record = {'case': case_name,
+                  'timings': dict(self.timings),
+                  'calls': dict(self.calls),
+                  'counters': dict(self.counters)}
+        record.update(extra)
+        return record
+
+    def dump(self, save_path: str, case_name: str, **extra) -> str:
+        '''
+        description: save the record of this case into a json file
+        return {str} the json file name
+        '''
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        file_name = os.path.join(save_path, 'Profile_' + case_name + '.json')
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.record(case_name=case_name, **extra), f, indent=2)
+        return file_name
+
+    @staticmethod
+    @contextmanager
+    def cprofile(save_file: str = None):
+        '''
+        description: run the with block under cProfile and dump the stats,
+                     nothing is done if save_file is None
+        param {str} save_file: the .prof file name
+        '''
+        if save_file is None:
+            yield None
+            return
+        save_dir = os.path.dirname(save_file)
+        if save_dir and not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield prof
+        finally:
+            prof.disable()
+            prof.dump_stats(save_file)
+
+
+profiler = Profiler()
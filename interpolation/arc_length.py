@@ -0,0 +1,119 @@
+'''
+FilePath: /Automated Valet Parking/interpolation/arc_length.py
+Description: cumulative arc length table of a piecewise curve, the points
+             of a given arc length are evaluated in one array operation
+'''
+
+
+import numpy as np
+from util_math.spline import piecewise_curve
+
+
+def gauss_legendre(curve: piecewise_curve,
+                   index: np.array,
+                   u0: np.array,
+                   u1: np.array,
+                   order: int = 5) -> np.array:
+    '''
+    description: the arc length of the pieces between u0 and u1 by the
+    gauss legendre quadrature, all intervals are computed in one batch
+    param {np.array} index: the piece index of each interval
+    param {np.array} u0, u1: the parameters of the interval
+    return {np.array} the arc length of each interval
+    '''
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    half = (u1 - u0) / 2
+    middle = (u1 + u0) / 2
+    u = (middle[:, None] + half[:, None] * nodes[None, :]).flatten()
+    speed = curve.speed(np.repeat(index, order), u).reshape(-1, order)
+    return half * (speed @ weights)
+
+
+def adaptive_gauss_legendre(curve: piecewise_curve,
+                            index: np.array,
+                            tolerance: float = 1e-8,
+                            order: int = 5,
+                            max_depth: int = 20) -> np.array:
+    '''
+    description: the arc length of the whole pieces, an interval is split
+    into two halves until the length of the halves is equal to the length
+    of the interval within the tolerance (m)
+    param {np.array} index: the piece index
+    return {np.array} the arc length of each piece
+    '''
+    length = np.zeros(len(index))
+    # the intervals to be checked, the position is the row in length
+    position = np.arange(len(index))
+    u0 = np.zeros(len(index))
+    u1 = np.ones(len(index))
+    whole = gauss_legendre(curve, index, u0, u1, order)
+    for depth in range(max_depth):
+        middle = (u0 + u1) / 2
+        left = gauss_legendre(curve, index, u0, middle, order)
+        right = gauss_legendre(curve, index, middle, u1, order)
+        split = left + right
+        accept = np.abs(split - whole) <= tolerance
+        if depth == max_depth - 1:
+            accept[:] = True
+        np.add.at(length, position[accept], split[accept])
+        refine = ~accept
+        if not np.any(refine):
+            break
+        # split the refined intervals into two halves
+        index = np.tile(index[refine], 2)
+        position = np.tile(position[refine], 2)
+        u0, u1 = np.concatenate((u0[refine], middle[refine])), \
+            np.concatenate((middle[refine], u1[refine]))
+        whole = np.concatenate((left[refine], right[refine]))
+        tolerance = tolerance / 2
+    return length
+
+
+class arc_length_table:
+    def __init__(self,
+                 curve: piecewise_curve,
+                 sample_num: int = 33,
+                 order: int = 3,
+                 adaptive: bool = False,
+                 tolerance: float = 1e-8) -> None:
+        '''
+        description: sample the parameter u of each piece, the arc length
+        between two samples is integrated by the gauss legendre quadrature
+        param {piecewise_curve} curve: the curve of the path
+        param {int} sample_num: the number of samples of each piece
+        param {int} order: the number of the gauss legendre nodes
+        param {bool} adaptive: the length of each piece is computed by the
+                               adaptive quadrature with the tolerance (m)
+        '''
+        self.curve = curve
+        piece_num = curve.piece_num
+        u = np.linspace(0, 1, sample_num)
+        index = np.repeat(np.arange(piece_num), sample_num - 1)
+        interval_length = gauss_legendre(curve, index,
+                                         np.tile(u[:-1], piece_num),
+                                         np.tile(u[1:], piece_num),
+                                         order).reshape(piece_num, sample_num - 1)
+        # the arc length from the start of the piece
+        piece_s = np.zeros((piece_num, sample_num))
+        piece_s[:, 1:] = np.cumsum(interval_length, axis=1)
+        if adaptive:
+            length = adaptive_gauss_legendre(curve, np.arange(piece_num), tolerance)
+            piece_s *= (length / np.maximum(piece_s[:, -1], 1e-12))[:, None]
+
+        self.piece_length = piece_s[:, -1]
+        self.piece_start = np.concatenate(([0], np.cumsum(self.piece_length)[:-1]))
+        self.total_length = float(np.sum(self.piece_length))
+        # s -> piece index + u, both increase along the path
+        self.s_table = (piece_s + self.piece_start[:, None]).flatten()
+        self.u_table = (u[None, :] + np.arange(piece_num)[:, None]).flatten()
+
+    def evaluate(self, s):
+        '''
+        description: evaluate the curve at the arc length s
+        param {*} s: a float or a numpy array of the arc length from the start point
+        return {*} x, y, the direction of the tangent and the curvature
+        '''
+        s = np.clip(np.asarray(s, dtype=np.float64), 0, self.total_length)
+        u = np.interp(s, self.s_table, self.u_table)
+        index = np.minimum(np.floor(u).astype(int), self.curve.piece_num - 1)
+        return self.curve.evaluate(index, u - index)
@@ -10,14 +10,12 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 '''
 
 
-import math
-from typing import List, Dict, Tuple
+from typing import Dict, Tuple
 import numpy as np
 from scipy import integrate
-from path_plan.rs_curve import pi_2_pi
-from animation.animation import *
-from util_math.spline import spine
-from util_math.coordinate_transform import coordinate_transform
+from util_math.spline import local_cubic_curve, parametric_spline
+from interpolation.arc_length import arc_length_table
+from util_math.trajectory import Trajectory
 
 
 class interpolation:
@@ -33,20 +31,28 @@ class interpolation:
         self.map = map
         self.insert_num = config["velocity_plan_num"]
         self.vehicle = vehicle
+        self.spline_type = config.get('spline_type', 'parametric')
+        self.spline_boundary = config.get('spline_boundary', 'clamped')
+        self.arc_length_adaptive = config.get('arc_length_adaptive', False)
+        self.arc_length_tolerance = config.get('arc_length_tolerance', 1e-8)
 
     def cubic_interpolation(self,
-                            path: list,
+                            path: Trajectory,
                             path_i_info: dict,
                             v_a_func,
                             forward: bool = None,
                             terminate_t: np.float64 = None,
-                            path_arc_length=None) -> List[List]:
+                            path_arc_length=None,
+                            s_func=None) -> Trajectory:
         '''
-        description:
+        description: the inserted points are sampled by the time and placed
+        on the path by their travel distance s(t) with the arc length table
         path: the interporlation path
-        path_i_info: dict including the cubic function_list and the rotation matrix_list
+        path_i_info: dict including the curve and the arc length table of the path
         v_a_func: the velocity function and the acceleration function
-        return {*} the interpolation function
+        s_func: the distance function of the velocity, if it is None the
+                distance is integrated from the velocity
+        return {Trajectory} x,y,theta,v,a,sigma,omega,t of the inserted points
         '''
 
         # update the theta of waypoints
@@ -54,176 +60,84 @@ class interpolation:
             self.insert_num = 25
         elif path_arc_length >= 1 and path_arc_length <= 2:
             self.insert_num = 50
-        t = 0
-        preivous_t = 0
-        insert_path = []
-        cubic_func_list = path_i_info['cubic_list']
-        rotation_matrix_list = path_i_info['rotation_matrix_list']
-        new_end_list = path_i_info['new_end_list']
-        dt = terminate_t / self.insert_num
+        table = path_i_info['arc_length_table']
         if forward:
             direction = 1
         else:
             direction = -1
 
-        _, a = v_a_func(0)
-        a = a * direction
-
-        trans_path = [[0, 0, 0, 0, a, 0]]  # the first path point
-
-        for i in range(len(path) - 1):
-            cubic_func = cubic_func_list[i]
-            new_end = new_end_list[i]
-            # insert points in the transformed accordinate
-            while True:
-                preivous_t = t
-                t += dt
-                if t > terminate_t:
-                    t = terminate_t
-                t_x = np.linspace(preivous_t, t, 100)
-                y = []
-                for x_i in t_x:
-                    v_y, _ = v_a_func(x_i)
-                    y.append(v_y)
-                y = np.array(y)
-                delta_s = integrate.simpson(y=y, x=t_x)
-                insert_x = trans_path[-1][0] + \
-                    direction * abs(delta_s) * np.cos(trans_path[-1][2])
-                v, a = v_a_func(t)
-                v = v * direction
-                a = a * direction
-                # compute the inserted point
-
-                if abs(insert_x) > abs(new_end[0]):
-                    # compute the time from the current point to the new_end point
-                    # t_previous = (new_end[0] - trans_path[-1][0]) / \
-                    #     (trans_path[-1][3]*np.cos(trans_path[-1][2]))
-                    rest_x = insert_x - new_end[0]
-                    break
-                else:
-                    insert_y, _, insert_theta = cubic_func(insert_x)
-                    # insert the points in the trans path list
-                    trans_path.append(
-                        [insert_x, insert_y, insert_theta, v, a, t])
-                    if abs(t - terminate_t) < 1e-7:
-                        break
-
-            # inverse transform these points into the original coordinate
-            start_point = path[i]
-            rotation_matrix = rotation_matrix_list[i]
-            inverse_path = coordinate_transform.inverse_trans(trans_path=trans_path,
-                                                              rotation_matrix=rotation_matrix,
-                                                              start=start_point)
-            insert_path.extend(inverse_path)
-            trans_path = []
-
-            if i == len(path) - 2:
-                # add the end point
-                end_point = path[i+1]
-                end_point.extend([0, 0, terminate_t])
-                # insert_path.append(end_point)
-                for k in range(len(end_point)):
-                    insert_path[-1][k] = end_point[k]
-            else:
-                next_cubic_func = cubic_func_list[i+1]
-                insert_y, _, insert_theta = next_cubic_func(rest_x)
-                v, a = v_a_func(t)
-                v = v * direction
-                a = a * direction
-                trans_path.append([rest_x, insert_y, insert_theta, v, a, t])
-
-        # recompute the theta
-        for i in range(len(insert_path)-2):
-            if forward:
-                theta_angle = np.arctan2(
-                    (insert_path[i+2][1] - insert_path[i+1][1]), insert_path[i+2][0]-insert_path[i+1][0])
-            else:
-                theta_angle = np.arctan2(
-                    (insert_path[i+1][1] - insert_path[i+2][1]), insert_path[i+1][0]-insert_path[i+2][0])
-            theta_angle = pi_2_pi(theta_angle)
-            insert_path[i+1][2] = theta_angle
-
-        # check the continuity of the theta angle
-        # for i in range(len(insert_path)-1):
-        #     if abs(insert_path[i+1][2] - insert_path[i][2]) <= np.pi:
-        #         continue
-        #     else:
-        #         while insert_path[i+1][2] - insert_path[i][2] > np.pi:
-        #             insert_path[i+1][2] -= np.pi
-        #         while insert_path[i+1][2] - insert_path[i][2] < np.pi:
-        #             insert_path[i+1][2] += np.pi
+        # the time and the travel distance of the inserted points
+        t = np.linspace(0, terminate_t, self.insert_num + 1)
+        if s_func is not None:
+            s = s_func(t)
+        else:
+            t_x = np.linspace(0, terminate_t, 100 * self.insert_num + 1)
+            v_x, _ = v_a_func(t_x)
+            s = np.interp(t, t_x, integrate.cumulative_trapezoid(v_x, t_x, initial=0))
+
+        # evaluate all the points on the path at once, the heading is the
+        # opposite of the tangent if the vehicle moves backward
+        x, y, theta, _ = table.evaluate(s)
+        if not forward:
+            theta = theta + np.pi
+        v, a = v_a_func(t)
+
+        # the trajectory of the inserted points, x,y,theta,v,a,sigma,omega,t
+        insert_path = Trajectory.empty(len(t))
+        trajectory = insert_path.data
+        trajectory[:, 0] = x
+        trajectory[:, 1] = y
+        trajectory[:, 2] = theta
+        trajectory[:, 3] = v * direction
+        trajectory[:, 4] = a * direction
+        trajectory[:, 7] = t
+
+        # the first point and the end point are the points of the path,
+        # the velocity and acceleration are zero at the change gear point
+        trajectory[0, :3] = path[0][:3]
+        trajectory[-1, :5] = [path[-1][0], path[-1][1], path[-1][2], 0, 0]
+
+        # recompute the theta by the direction to the next point
+        delta_position = np.diff(trajectory[1:, :2], axis=0) * direction
+        trajectory[1:-1, 2] = np.arctan2(delta_position[:, 1], delta_position[:, 0])
 
         # check the theta continuity
-        for i in range(len(insert_path)-1):
-            if abs(insert_path[i][2] - insert_path[i+1][2]) <= math.pi:
-                continue
-            else:
-                if (insert_path[i+1][2] - insert_path[i][2]) < 0:
-                    while (insert_path[i+1][2] - insert_path[i][2]) < -math.pi:
-                        insert_path[i+1][2] += 2*math.pi
-                else:
-                    while (insert_path[i+1][2] - insert_path[i][2]) > math.pi:
-                        insert_path[i+1][2] -= 2*math.pi
-
-        # compute steering angle and check the theta
-        for i in range(len(insert_path) - 1):
-            if i > 0:
-                steering_angle = math.atan((insert_path[i+1][2] - insert_path[i][2]) * self.vehicle.lw /
-                                           (insert_path[i][3] * (insert_path[i+1][-1] - insert_path[i][-1])))
-                steering_angle = pi_2_pi(steering_angle)
-                if i == 1:
-                    insert_path[0].insert(5, steering_angle)
-                insert_path[i].insert(5, steering_angle)
-                delta_steering_angle = insert_path[i][5] - insert_path[i-1][5]
-                delta_time = insert_path[i][-1] - insert_path[i-1][-1]
-                omega = delta_steering_angle / delta_time
-                insert_path[i-1].insert(6, omega)
-
-        # make sure the velocity, acceleration, steering angle is zero at the change gear point
-        insert_path[-1][3] = 0  # velocity
-        insert_path[-1][4] = 0  # acceleration
-        # keep the steering angle
-        insert_path[-1].insert(5, insert_path[-2][5])
-        insert_path[-1].insert(6, 0)  # omega
-        omega = (insert_path[-1][5] - insert_path[-2][5]) / \
-            (insert_path[-1][-1] - insert_path[-2][-1])
-        insert_path[-2].insert(6, omega)
-        # insert_path[-2].insert(6, 0)
+        trajectory[:, 2] = np.unwrap(trajectory[:, 2])
+
+        # compute steering angle by the change of theta, the first point and
+        # the end point keep the steering angle of their neighbour
+        delta_theta = np.diff(trajectory[:, 2])
+        delta_time = np.diff(trajectory[:, 7])
+        trajectory[1:-1, 5] = np.arctan(delta_theta[1:] * self.vehicle.lw /
+                                        (trajectory[1:-1, 3] * delta_time[1:]))
+        trajectory[0, 5] = trajectory[1, 5]
+        trajectory[-1, 5] = trajectory[-2, 5]
+        # omega of the end point is zero
+        trajectory[:-1, 6] = np.diff(trajectory[:, 5]) / delta_time
 
         return insert_path
 
     def cubic_fitting(self,
-                      path: List[List] = None) -> Tuple[np.float64, Dict]:
+                      path: Trajectory = None) -> Tuple[np.float64, Dict]:
         '''
-        description: the path is the splited path
+        description: the path is the splited path, it is fitted by one
+        parametric spline (spline_type: parametric) or by a cubic function
+        of each pair of points (spline_type: cubic)
         return {*} the arc length of this period path and the path info, 
-        including the rotation matrix and the cubic function
+        including the curve of the path and its arc length table
         '''
-        cubic_func_list = []
-        rotation_matrix_list = []
-        arc_lenth_list = []
-        new_end_list = []
-        start_point = path[0]
-        arc_lenth = 0
-        for i in range(1, len(path)):
-            end_point = path[i]
-            cubic_func, rotation_matrix, new_end = spine.cubic_spline(
-                start=start_point, end=end_point)
-            arc_lenth_i = spine.Simpson_integral(
-                cubic_func, [0, 0], new_end)
-
-            cubic_func_list.append(cubic_func)
-            rotation_matrix_list.append(rotation_matrix)
-            new_end_list.append(new_end)
-            arc_lenth_list.append(arc_lenth_i)
-
-            arc_lenth += arc_lenth_i
-
-            start_point = end_point
-
-        path_i_info = {'cubic_list': cubic_func_list,
-                       'rotation_matrix_list': rotation_matrix_list,
-                       'arc_len_list': arc_lenth_list,
-                       'new_end_list': new_end_list}
-
-        return arc_lenth, path_i_info
+        if self.spline_type == 'parametric':
+            curve = parametric_spline(path, boundary=self.spline_boundary)
+        elif self.spline_type == 'cubic':
+            curve = local_cubic_curve(path)
+        else:
+            raise Exception("the spline type is not defined")
+        table = arc_length_table(curve,
+                                 adaptive=self.arc_length_adaptive,
+                                 tolerance=self.arc_length_tolerance)
+
+        path_i_info = {'curve': curve,
+                       'arc_length_table': table,
+                       'arc_len_list': table.piece_length.tolist()}
+
+        return table.total_length, path_i_info
@@ -10,15 +10,10 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 '''
 
 
-from path_plan import path_planner
-from animation.animation import ploter, plt
+from pipeline.parking_pipeline import ParkingPipeline
 from animation.record_solution import DataRecorder
-from animation.curve_plot import CurvePloter
-from map import costmap
-from velocity_plan import velocity_planner
-from interpolation import path_interpolation
-from optimization import path_optimazition, ocp_optimization
 from config import read_config
+from instrumentation.profiler import profiler, Profiler
 
 import os
 
@@ -26,87 +21,53 @@ import argparse
 
 
 def main(file, config):
-    # create the park map
-    park_map = costmap.Map(
-        file=file, discrete_size=config['map_discrete_size'])
-
-    # create vehicle
-    ego_vehicle = costmap.Vehicle()
-
-    # create path planner
-    planner = path_planner.PathPlanner(config=config,
-                                       map=park_map,
-                                       vehicle=ego_vehicle)
-
-    # create path optimizer
-    path_optimizer = path_optimazition.path_opti(park_map, ego_vehicle, config)
-
-    # create path interpolation
-    interplotor = path_interpolation.interpolation(
-        config=config, map=park_map, vehicle=ego_vehicle)
-
-    # create velocity planner
-    v_planner = velocity_planner.VelocityPlanner(vehicle=ego_vehicle,
-                                                 velocity_func_type=config['velocity_func_type'])
-
-    # create path optimization planner
-    ocp_planner = ocp_optimization.ocp_optimization(
-        park_map=park_map, vehicle=ego_vehicle, config=config)
-
-    # rapare memory to store path
-    final_opt_path = []  # store the optimization path
-    final_insert_path = []  # store the interpolation path
-    final_ocp_path = []  # store ocp path
-
-    # path planning
-    optimal_tf = 0
-    pre_tf = 0
-    t = 0
-    optimal_time_info = []
-    original_path, path_info, split_path = planner.path_planning()
-    final_pre_opt_path = []
-    for path_i in split_path:
-        # optimize path
-        opti_path, forward = path_optimizer.get_result(path_i)
-
-        # cubic fitting
-        path_arc_length, path_i_info = interplotor.cubic_fitting(opti_path)
-
-        # velocity planning
-        v_acc_func, terminiate_time = v_planner.solve_nlp(
-            arc_length=path_arc_length)
-
-        # insert points
-        insert_path = interplotor.cubic_interpolation(
-            path=opti_path, path_i_info=path_i_info, v_a_func=v_acc_func, forward=forward, terminate_t=terminiate_time, path_arc_length=path_arc_length)
-
-        # ocp problem solve
-        ocp_traj, optimal_ti, optimal_dt = ocp_planner.solution(
-            path=insert_path)
-        pre_tf += insert_path[-1][-1]
-        optimal_time_info.append([optimal_ti, optimal_dt])
-        final_pre_opt_path.extend(insert_path)
-        # add time information
-        for ocp_i in ocp_traj:
-            t += optimal_dt
-            ocp_i.append(t)
-        optimal_tf += optimal_ti
-
-        final_opt_path.extend(opti_path)
-        final_insert_path.extend(insert_path)
-        final_ocp_path.extend(ocp_traj)
+    profiler.reset()
+    pipeline = ParkingPipeline(file=file, config=config)
+    result = pipeline.run()
+    park_map = pipeline.park_map
+    original_path = result['original_path']
+    final_opt_path = result['opt_path']
+    final_insert_path = result['insert_path']
+    final_ocp_path = result['ocp_path']
+    optimal_tf = result['optimal_tf']
+    pre_tf = result['pre_tf']
 
     # print time
     print('trajectory_time:', optimal_tf)
     print('pre_optimization_time:', pre_tf)
-
-    # save traj into a csv file
+    failed_segments = [i for i, success in enumerate(result['ocp_success']) if not success]
+    if len(failed_segments) > 0:
+        print('warning: the ocp of the segments', failed_segments, 'did not converge')
+
+    # save traj into a csv file or a .npy file with its metadata
+    solution_format = config.get('solution_format', 'csv')
+    metadata = {'case': args.case_name,
+                'config_hash': DataRecorder.config_hash(config),
+                'stage_timings': dict(profiler.timings),
+                'trajectory_time': optimal_tf,
+                'ocp_success': result['ocp_success']}
     DataRecorder.record(save_path=config['save_path'],
-                        save_name=case_name, trajectory=final_ocp_path)
+                        save_name=case_name, trajectory=final_ocp_path,
+                        file_format=solution_format, metadata=metadata)
     DataRecorder.record(save_path=config['save_path'] + '_preopt',
-                        save_name=case_name, trajectory=final_ocp_path)
-
-    # animation
+                        save_name=case_name, trajectory=final_ocp_path,
+                        file_format=solution_format, metadata=metadata)
+
+    # save the stage timings and counters into a json file
+    if config['profile']:
+        profiler.dump(save_path=config['profile_path'],
+                      case_name=args.case_name,
+                      segment_num=len(result['split_path']),
+                      trajectory_time=optimal_tf,
+                      pre_optimization_time=pre_tf,
+                      ocp_success=result['ocp_success'])
+
+    if config['headless']:
+        print('solved')
+        return
+
+    # animation, matplotlib is only imported if we plot the result
+    from animation.animation import ploter, plt
     ploter.plot_obstacles(map=park_map)
     park_map.visual_cost_map()
     ploter.plot_final_path(path=original_path, label='Hybrid A*',
@@ -138,24 +99,36 @@ if __name__ == '__main__':
     parser.add_argument("--case_name", type=str, default="Case2")
     parser.add_argument("--mode", type=int, default=1,
                         help='0: solve this scenario, 1: load result and plot figure')
+    parser.add_argument("--headless", action='store_true',
+                        help='solve the scenario without any plot')
     args = parser.parse_args()
 
     # initial
     # load configure file to a dict
     config = read_config.read_config(config_name=args.config_name)
+    if args.headless:
+        config['headless'] = True
 
     # read benchmark case
     case_name = args.case_name + '.csv'
     file = os.path.join(config['Benchmark_path'], case_name)
 
     if (args.mode == 0):
-        main(file=file, config=config)
+        # dump the cProfile stats if required
+        cprofile_file = None
+        if config['cprofile']:
+            cprofile_file = os.path.join(config['profile_path'],
+                                         'Profile_' + args.case_name + '.prof')
+        with Profiler.cprofile(save_file=cprofile_file):
+            main(file=file, config=config)
     elif (args.mode == 1):
-        data_save_name = 'Solution_' + case_name
+        data_save_name = DataRecorder.solution_name(
+            case_name, config.get('solution_format', 'csv'))
         data_save_path = config['save_path']
 
         save_fig_path = os.path.join(config['pic_path'], args.case_name)
 
+        from animation.curve_plot import CurvePloter
         CurvePloter.plot_curve(data_save_path = data_save_path,
                                data_save_name = data_save_name,
                                save_fig_path = save_fig_path)
@@ -0,0 +1,132 @@
+'''
+FilePath: /Automated Valet Parking/map/case_cache.py
+Description: compiled benchmark cases, the parsed case and its rasterized
+             cost map are stored in one uncompressed .npz file
+
+the arrays of the .npz file are memory mapped when the case is loaded, so
+the csv file is not parsed and the obstacles are not rasterized again.
+a compiled case is rebuilt if the md5 of the csv file or the resolution
+does not match.
+'''
+
+
+from typing import Dict
+import hashlib
+import os
+import struct
+import zipfile
+import numpy as np
+
+
+CASE_CACHE_VERSION = 1
+
+
+def memmap_npz(file: str) -> Dict[str, np.array]:
+    '''
+    description: memory map the arrays of an uncompressed .npz file, np.load
+    reads the whole array of an .npz member into memory
+    param {str} file: the .npz file saved by np.savez
+    return {Dict} name -> the array of the copy on write memory map
+    '''
+    arrays = {}
+    with zipfile.ZipFile(file) as archive, open(file, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise Exception("the compressed npz member is not supported")
+            # the data starts after the local file header, its name and
+            # extra field have variable lengths
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            # a plain array view of the memory map, indexing a np.memmap
+            # returns np.memmap objects which are slow to create
+            arrays[name] = np.asarray(np.memmap(file, dtype=dtype, mode='c', shape=shape,
+                                                offset=f.tell(),
+                                                order='F' if fortran_order else 'C'))
+    return arrays
+
+
+class case_cache:
+    def __init__(self, save_path: str) -> None:
+        '''
+        param {str} save_path: the folder of the compiled cases
+        '''
+        self.save_path = save_path
+
+    @staticmethod
+    def source_md5(file: str) -> str:
+        with open(file, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def cache_file(self, file: str, discrete_size: float) -> str:
+        '''
+        return the compiled file of the case at the resolution, e.g. Case1_0.1.npz
+        '''
+        name = os.path.splitext(os.path.basename(file))[0]
+        return os.path.join(self.save_path, '%s_%s.npz' % (name, repr(float(discrete_size))))
+
+    def load(self, file: str, discrete_size: float) -> Dict:
+        '''
+        description: load the compiled case if it matches the csv file
+        param {str} file: the csv file of the case
+        param {float} discrete_size: the resolution of the cost map
+        return {Dict} None if there is no valid compiled case, otherwise
+            start, goal: x,y,theta of the initial and goal pose
+            limits: xmin, xmax, ymin, ymax of the case
+            vertex_num: the number of vertexes of each obstacle
+            vertices: [[x,y],...] of all obstacles
+            cost_map: the rasterized cost map
+        '''
+        cache_file = self.cache_file(file, discrete_size)
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            compiled = memmap_npz(cache_file)
+        except Exception:
+            return None
+        if int(compiled['version'][0]) != CASE_CACHE_VERSION or \
+                str(compiled['source_md5'][0]) != self.source_md5(file) or \
+                float(compiled['discrete_size'][0]) != float(discrete_size):
+            return None
+        return compiled
+
+    def save(self, file: str, discrete_size: float, case, cost_map: np.array) -> str:
+        '''
+        description: compile the case and its cost map into one .npz file
+        param {str} file: the csv file of the case
+        param {Case} case: the case read from the csv file
+        param {np.array} cost_map: the rasterized cost map of the resolution
+        return {str} the compiled file
+        '''
+        if not os.path.exists(self.save_path):
+            os.makedirs(self.save_path, exist_ok=True)
+        cache_file = self.cache_file(file, discrete_size)
+        vertex_num = np.array([len(obs) for obs in case.obs], dtype=np.int32)
+        if len(case.obs) > 0:
+            vertices = np.concatenate(case.obs).astype(np.float64)
+        else:
+            vertices = np.zeros((0, 2))
+        # write a temporary file first, the compiled file is replaced at once
+        temp_file = cache_file + '.%d.npz' % os.getpid()
+        np.savez(temp_file,
+                 version=np.array([CASE_CACHE_VERSION]),
+                 source_md5=np.array([self.source_md5(file)]),
+                 discrete_size=np.array([discrete_size], dtype=np.float64),
+                 start=np.array([case.x0, case.y0, case.theta0], dtype=np.float64),
+                 goal=np.array([case.xf, case.yf, case.thetaf], dtype=np.float64),
+                 limits=np.array([case.xmin, case.xmax, case.ymin, case.ymax], dtype=np.float64),
+                 vertex_num=vertex_num,
+                 vertices=vertices,
+                 cost_map=np.ascontiguousarray(cost_map, dtype=np.float64))
+        os.replace(temp_file, cache_file)
+        return cache_file
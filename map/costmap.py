@@ -46,8 +46,8 @@ import string
 import numpy as np
 import math
 import csv
-import shapely.geometry
-import matplotlib.pyplot as plt
+
+
 class Vehicle:
     def __init__(self):
         self.lw = 2.8  # wheelbase
@@ -57,6 +57,7 @@ class Vehicle:
         self.max_steering_angle = 0.75  # rad
         self.max_angular_velocity = 0.5  # rad/s
         self.max_acc = 1  # m/s^2
+        self.max_jerk = 1  # m/s^3
         self.max_v = 2.5  # m/s
         self.min_v = -2.5  # m/s
         self.min_radius_turn = self.lw / \
@@ -155,16 +156,47 @@ class Case:
                     np.array(v[vs:vs + nv * 2]).reshape((nv, 2), order='A'))
         return case
 
+    @staticmethod
+    def read_compiled(compiled: dict):
+        '''
+        description: the case of the compiled arrays, see map/case_cache.py,
+                     the obstacles are views of the memory mapped vertices
+        '''
+        case = Case()
+        case.x0, case.y0, case.theta0 = compiled['start'].tolist()
+        case.xf, case.yf, case.thetaf = compiled['goal'].tolist()
+        case.xmin, case.xmax, case.ymin, case.ymax = compiled['limits'].tolist()
+        vertex_num = compiled['vertex_num']
+        case.obs_num = len(vertex_num)
+        case.obs = np.split(compiled['vertices'], np.cumsum(vertex_num)[:-1])
+        if case.obs_num == 0:
+            case.obs = []
+        return case
+
 
 class Map:
     def __init__(self,
                  discrete_size: np.float64 = 0.1,
-                 file: string = None) -> None:
+                 file: string = None,
+                 cache_path: string = None) -> None:
+        '''
+        param {str} cache_path: the folder of the compiled cases, if it is
+        not None the case and the cost map are loaded from the compiled
+        case, or compiled after they are built, see map/case_cache.py
+        '''
         self.discrete_size = discrete_size
         self.grid_index = None  # index of each grid
         self.cost_map = np.array([], dtype=np.float64)  # cost value
         self.map_position = np.array([], dtype=np.float64)  # (x,y) value
-        self.case = Case.read(file)
+        cache, compiled = None, None
+        if cache_path is not None:
+            from map.case_cache import case_cache
+            cache = case_cache(cache_path)
+            compiled = cache.load(file, discrete_size)
+        if compiled is not None:
+            self.case = Case.read_compiled(compiled)
+        else:
+            self.case = Case.read(file)
         # math.floor: return the largest integer not greater than x
         self.boundary = np.array([math.floor(self.case.xmin),
                                   math.floor(self.case.xmax),
@@ -173,7 +205,13 @@ class Map:
         # self.detect_obstacle()
         self._discrete_x = 0
         self._discrete_y = 0
-        self.detect_obstacle_edge()
+        if compiled is not None:
+            self.discrete_map()
+            self.cost_map = compiled['cost_map']
+        else:
+            self.detect_obstacle_edge()
+            if cache is not None:
+                cache.save(file, discrete_size, self.case, self.cost_map)
 
     def discrete_map(self):
         '''
@@ -261,6 +299,8 @@ class Map:
                                       ][int(points_y_index[0])] = 255
 
     def detect_obstacle(self):
+        # shapely is only needed for the polygon-exact obstacle detection
+        import shapely.geometry
         # discrete map
         self.discrete_map()
 
@@ -294,12 +334,12 @@ class Map:
         # print(self.cost_map.shape)
 
     def visual_cost_map(self):
+        import matplotlib.pyplot as plt
         plt.figure(1)
-        for i in range(len(self.map_position[0])):
-            for j in range(len(self.map_position[1])):
-                if self.cost_map[i][j] == 255:
-                    plt.plot(
-                        self.map_position[0][i], self.map_position[1][j], 'x', color='k')
+        # plot all obstacle grids with one call
+        obstacle_index = np.where(self.cost_map == 255)
+        plt.plot(self.map_position[0][obstacle_index[0]],
+                 self.map_position[1][obstacle_index[1]], 'x', color='k')
         plt.xlim(self.case.xmin, self.case.xmax)
         plt.ylim(self.case.ymin, self.case.ymax)
         plt.draw()
@@ -307,6 +347,7 @@ class Map:
         # print('ok')
 
     def visual_near_vehicle_map(self, xmin, xmax, ymin, ymax):
+        import matplotlib.pyplot as plt
         plt.figure(1)
         for i in range(len(self.map_position[0])):
             for j in range(len(self.map_position[1])):
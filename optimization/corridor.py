@@ -0,0 +1,303 @@
+'''
+FilePath: /Automated Valet Parking/optimization/corridor.py
+Description: compute the box bounds of the path points for the path
+             optimization and the ocp optimization with numpy broadcasting
+
+corridor_type in config:
+box: shrink the box of each point from expand_dis by the near obstacles
+stc: safe travel corridor, grow collision-free boxes along the path and
+     share one box between the consecutive points which stay safe in it.
+     the bounds are looser than box, but each point still has its own bound
+     constraints, so the qp and the ocp are not smaller. box is the default
+'''
+
+
+import math
+import numpy as np
+from map.costmap import Map, Vehicle
+from path_plan import rs_curve
+
+'''
+the sides of the vehicle box (anticlockwise from the right rear point)
+k = 0: right line
+k = 1: front line
+k = 2: left line
+k = 3: rear line
+AREA_SIGN[case][k] = (x sign, y sign), the area of the side k is expanded by
+expand_dis in these directions, and an obstacle in this area limits x_max
+(x sign = 1) or x_min (x sign = -1), y_max (y sign = 1) or y_min (y sign = -1)
+case 1: theta is in [0, pi/2)
+case 2: theta is in [pi/2, pi]
+case 3: theta is in [-pi, -pi/2)
+case 4: theta is in [-pi/2, 0)
+'''
+AREA_SIGN = {1: [(1, -1), (1, 1), (-1, 1), (-1, -1)],
+             2: [(1, 1), (-1, 1), (-1, -1), (1, -1)],
+             3: [(-1, 1), (-1, -1), (1, -1), (1, 1)],
+             4: [(-1, -1), (1, -1), (1, 1), (-1, 1)]}
+
+
+class corridor:
+    # the size of the (points, obstacles) block compared at one time
+    chunk_size = 4000000
+
+    @staticmethod
+    def obstacle_points(park_map: Map) -> np.array:
+        '''
+        return: the positions of the obstacle grids, [[x,y],...]
+        '''
+        obstacle_index = np.where(park_map.cost_map == 255)
+        obstacle_position_x = park_map.map_position[0][obstacle_index[0]]
+        obstacle_position_y = park_map.map_position[1][obstacle_index[1]]
+        return np.vstack((obstacle_position_x, obstacle_position_y)).transpose()
+
+    @staticmethod
+    def vehicle_corners(vehicle: Vehicle, x: np.array, y: np.array,
+                        theta: np.array, config: dict) -> np.array:
+        '''
+        the same as Vehicle.create_anticlockpoint for all points
+        return: shape is (points_n, 4, 2), right rear, right front, left front,
+                left rear point, these points have expanded
+        '''
+        side_dis = config['safe_side_dis']  # m
+        fr_dis = config['safe_fr_dis']  # m
+        local_x = np.array([-vehicle.lr-fr_dis, vehicle.lw+vehicle.lf+fr_dis,
+                            vehicle.lw+vehicle.lf+fr_dis, -vehicle.lr-fr_dis])
+        local_y = np.array([-vehicle.lb/2-side_dis, -vehicle.lb/2-side_dis,
+                            vehicle.lb/2+side_dis, vehicle.lb/2+side_dis])
+        cos_theta = np.cos(theta)[:, None]
+        sin_theta = np.sin(theta)[:, None]
+        corner_x = cos_theta * local_x + (-sin_theta) * local_y + x[:, None]
+        corner_y = sin_theta * local_x + cos_theta * local_y + y[:, None]
+        return np.stack((corner_x, corner_y), axis=2)
+
+    @staticmethod
+    def heading_case(theta: np.array) -> np.array:
+        case = np.zeros(len(theta), dtype=int)
+        case[(theta >= -math.pi) & (theta < -math.pi / 2)] = 3
+        case[(theta >= -math.pi / 2) & (theta < 0)] = 4
+        case[(theta >= 0) & (theta < math.pi / 2)] = 1
+        case[(theta >= math.pi / 2) & (theta <= math.pi)] = 2
+        return case
+
+    @staticmethod
+    def compute_box_bound(path, park_map: Map, vehicle: Vehicle,
+                          config: dict, expand_dis: float):
+        '''
+        description: find the obstacle grids near each expanded vehicle box
+        (AABB square expanded by expand_dis), each near obstacle belongs to the
+        first side area which contains it and limits the box of this point by
+        its horizontal and vertical distance to the side line.
+        [E;-E] X <= [H_max;-H_min]
+        param {*} path: [[x,y,theta,...],...]
+        return {*} x_max, y_max, x_min, y_min of all points
+        '''
+        path = np.asarray(path, dtype=np.float64)[:, :3]
+        x, y = path[:, 0], path[:, 1]
+        theta = np.array([rs_curve.pi_2_pi(t) for t in path[:, 2]])
+        points_n = len(path)
+
+        corners = corridor.vehicle_corners(vehicle, x, y, theta, config)
+        start, end = corners, np.roll(corners, -1, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # line of each side, y = k * x + b
+            line_k = (end[:, :, 1] - start[:, :, 1]) / \
+                (end[:, :, 0] - start[:, :, 0])
+            line_b = start[:, :, 1] - line_k * start[:, :, 0]
+        # area of each side, [x_min, x_max, y_min, y_max]
+        area = np.stack((np.minimum(start[:, :, 0], end[:, :, 0]),
+                         np.maximum(start[:, :, 0], end[:, :, 0]),
+                         np.minimum(start[:, :, 1], end[:, :, 1]),
+                         np.maximum(start[:, :, 1], end[:, :, 1])), axis=2)
+        sign = np.array([AREA_SIGN[c]
+                         for c in corridor.heading_case(theta)])
+        area_x_min = area[:, :, 0] - expand_dis * (sign[:, :, 0] < 0)
+        area_x_max = area[:, :, 1] + expand_dis * (sign[:, :, 0] > 0)
+        area_y_min = area[:, :, 2] - expand_dis * (sign[:, :, 1] < 0)
+        area_y_max = area[:, :, 3] + expand_dis * (sign[:, :, 1] > 0)
+
+        # AABB square of the expanded vehicle box
+        aabb = np.stack((corners[:, :, 0].min(axis=1) - expand_dis,
+                         corners[:, :, 0].max(axis=1) + expand_dis,
+                         corners[:, :, 1].min(axis=1) - expand_dis,
+                         corners[:, :, 1].max(axis=1) + expand_dis), axis=1)
+
+        # [x_min, x_max, y_min, y_max] distance from the point to the box
+        bound = expand_dis * np.ones((points_n, 4))
+        obstacles = corridor.obstacle_points(park_map)
+        chunk_n = max(1, corridor.chunk_size // max(len(obstacles), 1))
+        for chunk_start in range(0, points_n, chunk_n):
+            chunk = slice(chunk_start, min(chunk_start + chunk_n, points_n))
+            box = aabb[chunk]
+            near = (obstacles[None, :, 0] >= box[:, 0:1]) & \
+                (obstacles[None, :, 0] <= box[:, 1:2]) & \
+                (obstacles[None, :, 1] >= box[:, 2:3]) & \
+                (obstacles[None, :, 1] <= box[:, 3:4])
+            point_index, obstacle_index = np.nonzero(near)
+            point_index += chunk_start
+            obs_x = obstacles[obstacle_index, 0][:, None]
+            obs_y = obstacles[obstacle_index, 1][:, None]
+
+            # the first area which contains the obstacle
+            inside = (obs_x > area_x_min[point_index]) & (obs_x < area_x_max[point_index]) & \
+                (obs_y > area_y_min[point_index]) & (obs_y < area_y_max[point_index])
+            found = inside.any(axis=1)
+            point_index = point_index[found]
+            side = np.argmax(inside[found], axis=1)
+            obs_x, obs_y = obs_x[found, 0], obs_y[found, 0]
+
+            # horizontal and vertical distance to the side line
+            k = line_k[point_index, side]
+            b = line_b[point_index, side]
+            point_theta = theta[point_index]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                shortest_dis = abs(k * obs_x + b - obs_y) / np.sqrt(1+pow(k, 2))
+                vertical_dis = shortest_dis / abs(np.cos(point_theta))
+                horizon_dis = shortest_dis / abs(np.sin(point_theta))
+            # nan never limits the box
+            horizon_dis[np.isnan(horizon_dis)] = np.inf
+            vertical_dis[np.isnan(vertical_dis)] = np.inf
+
+            side_sign = sign[point_index, side]
+            x_column = np.where(side_sign[:, 0] > 0, 1, 0)
+            y_column = np.where(side_sign[:, 1] > 0, 3, 2)
+            np.minimum.at(bound, (point_index, x_column), horizon_dis)
+            np.minimum.at(bound, (point_index, y_column), vertical_dis)
+
+        x_min, x_max, y_min, y_max = bound[:, 0], bound[:, 1], bound[:, 2], bound[:, 3]
+        return x_max + x, y_max + y, x - x_min, y - y_min
+
+    @staticmethod
+    def footprint(vehicle: Vehicle, config: dict):
+        '''
+        return: the center offset along the heading, the half length and the
+                half width of the expanded vehicle box
+        '''
+        front = vehicle.lw + vehicle.lf + config['safe_fr_dis']
+        rear = vehicle.lr + config['safe_fr_dis']
+        return (front - rear) / 2, (front + rear) / 2, vehicle.lb / 2 + config['safe_side_dis']
+
+    @staticmethod
+    def box_collision(box: np.array, theta: float, obstacles: np.array,
+                      vehicle: Vehicle, config: dict) -> bool:
+        '''
+        description: the vehicle collides with the obstacles at some position in
+        the box, i.e. an obstacle point is in the minkowski sum of the box and
+        the vehicle box. separating axis test of the vehicle box and the
+        obstacle point minus the box.
+        param {np.array} box: [x_min, x_max, y_min, y_max] of the vehicle position
+        '''
+        if len(obstacles) == 0:
+            return False
+        offset, half_length, half_width = corridor.footprint(vehicle, config)
+        cos_theta, sin_theta = math.cos(theta), math.sin(theta)
+        # the box of obstacle - position
+        center_x = obstacles[:, 0] - (box[0] + box[1]) / 2
+        center_y = obstacles[:, 1] - (box[2] + box[3]) / 2
+        half_x = (box[1] - box[0]) / 2
+        half_y = (box[3] - box[2]) / 2
+        # the vehicle box
+        vehicle_x = offset * cos_theta
+        vehicle_y = offset * sin_theta
+        # x axis and y axis
+        overlap = abs(center_x - vehicle_x) <= half_x + \
+            half_length * abs(cos_theta) + half_width * abs(sin_theta)
+        overlap &= abs(center_y - vehicle_y) <= half_y + \
+            half_length * abs(sin_theta) + half_width * abs(cos_theta)
+        # heading axis and lateral axis of the vehicle
+        overlap &= abs((center_x - vehicle_x) * cos_theta + (center_y - vehicle_y) * sin_theta) <= \
+            half_length + half_x * abs(cos_theta) + half_y * abs(sin_theta)
+        overlap &= abs(-(center_x - vehicle_x) * sin_theta + (center_y - vehicle_y) * cos_theta) <= \
+            half_width + half_x * abs(sin_theta) + half_y * abs(cos_theta)
+        return bool(overlap.any())
+
+    @staticmethod
+    def grow_box(x: float, y: float, theta: float, obstacles: np.array,
+                 vehicle: Vehicle, config: dict, boundary: np.array):
+        '''
+        description: grow the box from the point in four directions by
+        corridor_step until the box collides or reaches corridor_max_expand
+        return {*} [x_min, x_max, y_min, y_max], None if the point collides
+        '''
+        step = config.get('corridor_step', 0.1)  # m
+        max_expand = config.get('corridor_max_expand', 2.0)  # m
+        box = np.array([x, x, y, y], dtype=np.float64)
+        if corridor.box_collision(box, theta, obstacles, vehicle, config):
+            return None
+        # [x_min, x_max, y_min, y_max] directions, the box stays in the map
+        direction = [-1, 1, -1, 1]
+        limit = [max(boundary[0], x - max_expand), min(boundary[1], x + max_expand),
+                 max(boundary[2], y - max_expand), min(boundary[3], y + max_expand)]
+        growing = [True] * 4
+        while any(growing):
+            for i in range(4):
+                if not growing[i]:
+                    continue
+                new_box = box.copy()
+                new_box[i] += direction[i] * step
+                if direction[i] * (new_box[i] - limit[i]) > 0 or \
+                        corridor.box_collision(new_box, theta, obstacles, vehicle, config):
+                    growing[i] = False
+                else:
+                    box = new_box
+        return box
+
+    @staticmethod
+    def compute_safe_corridor(path, park_map: Map, vehicle: Vehicle,
+                              config: dict, expand_dis: float):
+        '''
+        description: safe travel corridor, a point uses the box of the last point
+        if it is in this box and the box is still collision-free at its heading,
+        otherwise a new box is grown from this point. the point which collides
+        with the obstacle grids uses the bounds of compute_box_bound.
+        return {*} x_max, y_max, x_min, y_min of all points
+        '''
+        path = np.asarray(path, dtype=np.float64)[:, :3]
+        points_n = len(path)
+        obstacles = corridor.obstacle_points(park_map)
+        # only the obstacles which can reach the boxes
+        offset, half_length, half_width = corridor.footprint(vehicle, config)
+        reach = config.get('corridor_max_expand', 2.0) + abs(offset) + \
+            math.hypot(half_length, half_width)
+        near = (obstacles[:, 0] >= path[:, 0].min() - reach) & \
+            (obstacles[:, 0] <= path[:, 0].max() + reach) & \
+            (obstacles[:, 1] >= path[:, 1].min() - reach) & \
+            (obstacles[:, 1] <= path[:, 1].max() + reach)
+        obstacles = obstacles[near]
+
+        # [x_min, x_max, y_min, y_max] of each point
+        bound = np.zeros((points_n, 4))
+        box = None
+        fallback = None
+        for i, (x, y, theta) in enumerate(path):
+            theta = rs_curve.pi_2_pi(theta)
+            shared = box is not None and box[0] <= x <= box[1] and box[2] <= y <= box[3] and \
+                not corridor.box_collision(box, theta, obstacles, vehicle, config)
+            if not shared:
+                box = corridor.grow_box(x, y, theta, obstacles, vehicle,
+                                        config, park_map.boundary)
+            if box is None:
+                if fallback is None:
+                    fallback = corridor.compute_box_bound(
+                        path, park_map, vehicle, config, expand_dis)
+                x_max, y_max, x_min, y_min = fallback
+                bound[i] = [x_min[i], x_max[i], y_min[i], y_max[i]]
+            else:
+                bound[i] = box
+
+        return bound[:, 1], bound[:, 3], bound[:, 0], bound[:, 2]
+
+    @staticmethod
+    def compute_bound(path, park_map: Map, vehicle: Vehicle,
+                      config: dict, expand_dis: float):
+        '''
+        description: the box bounds of the path points by corridor_type in config
+        return {*} x_max, y_max, x_min, y_min of all points
+        '''
+        corridor_type = config.get('corridor_type', 'box')
+        if corridor_type == 'box':
+            return corridor.compute_box_bound(path, park_map, vehicle, config, expand_dis)
+        elif corridor_type == 'stc':
+            return corridor.compute_safe_corridor(path, park_map, vehicle, config, expand_dis)
+        else:
+            raise Exception("the corridor type is not defined")
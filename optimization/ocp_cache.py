@@ -0,0 +1,170 @@
+'''
+FilePath: /Automated Valet Parking/optimization/ocp_cache.py
+Description: cache of the ocp solutions used to warm start the ocp
+
+the key of a segment is the quantized signature
+    [start heading, goal x - start x, goal y - start y, goal heading, length]
+together with the gear and the number of points. the trajectory is stored
+relative to the start position, the ocp model is translation invariant
+but not rotation invariant (cos and sin are approximated around 0), so
+the heading is not removed from the signature.
+'''
+
+
+from collections import OrderedDict
+from typing import Dict
+import math
+import os
+import pickle
+import numpy as np
+
+
+class ocp_cache:
+    def __init__(self, config: dict) -> None:
+        self.position_step = config.get('ocp_cache_position_step', 0.5)  # m
+        self.heading_step = config.get('ocp_cache_heading_step', 0.1)  # rad
+        self.radius = config.get('ocp_cache_radius', 2)  # quantized steps
+        self.max_size = config.get('ocp_cache_size', 1000)
+        # the cache is only kept in memory unless it is persisted
+        self.save_path = config.get('ocp_cache_path', None) \
+            if config.get('ocp_cache_persist', False) else None
+        # (gear, points_n, signature) -> entry
+        self.entries = OrderedDict()
+        # the keys inserted since the cache is loaded or saved
+        self.new_keys = set()
+        self.load()
+
+    def cache_file(self) -> str:
+        if self.save_path is None:
+            return None
+        return os.path.join(self.save_path, 'ocp_cache.pkl')
+
+    def load(self):
+        cache_file = self.cache_file()
+        if cache_file is not None and os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                self.entries = pickle.load(f)
+
+    def save(self):
+        '''
+        description: write the cache file once, e.g. at the end of a run,
+        nothing is written if no entry is inserted
+        '''
+        cache_file = self.cache_file()
+        if cache_file is None or len(self.new_keys) == 0:
+            return
+        if not os.path.exists(self.save_path):
+            os.makedirs(self.save_path, exist_ok=True)
+        # keep the entries saved by other processes, e.g. the segment workers
+        if os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                entries = pickle.load(f)
+            for key, value in self.entries.items():
+                entries.pop(key, None)
+                entries[key] = value
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+            self.entries = entries
+        # write a temporary file first, the cache file is replaced at once
+        temp_file = cache_file + '.%d' % os.getpid()
+        with open(temp_file, 'wb') as f:
+            pickle.dump(self.entries, f)
+        os.replace(temp_file, cache_file)
+        self.new_keys.clear()
+
+    def pop_new_entries(self) -> Dict:
+        '''
+        return the entries inserted since the last call, e.g. the entries
+        of a segment worker which are merged by the main process
+        '''
+        entries = {key: self.entries[key] for key in self.new_keys if key in self.entries}
+        self.new_keys.clear()
+        return entries
+
+    def merge(self, entries: Dict):
+        '''
+        description: add the entries of another cache, see pop_new_entries
+        '''
+        for key, value in entries.items():
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            self.new_keys.add(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def signature(self, path: np.array) -> tuple:
+        '''
+        param {np.array} path: [[x,y,theta,v,...],...] of the segment
+        return {tuple} gear, points_n, quantized signature
+        '''
+        start, goal = path[0], path[-1]
+        length = np.sum(np.hypot(np.diff(path[:, 0]), np.diff(path[:, 1])))
+        values = np.array([start[2] / self.heading_step,
+                           (goal[0] - start[0]) / self.position_step,
+                           (goal[1] - start[1]) / self.position_step,
+                           goal[2] / self.heading_step,
+                           length / self.position_step])
+        gear = 1 if np.sum(path[:, 3]) >= 0 else -1
+        return gear, len(path), tuple(np.round(values).astype(int).tolist())
+
+    def query(self, path: np.array) -> Dict:
+        '''
+        description: find the nearest cached solution of the segment
+        param {np.array} path: [[x,y,theta,v,a,sigma,omega],...] the initial guess
+        return {Dict} None if there is no similar segment, otherwise
+            path: the cached trajectory moved to the start and the goal of the segment
+            tf: the cached time
+            lam_x, lam_g: the cached multipliers, None if not stored
+            exact: True if the signature is the same
+        '''
+        gear, points_n, signature = self.signature(path)
+        entry = self.entries.get((gear, points_n, signature))
+        exact = entry is not None
+        if entry is None:
+            best_distance = self.radius + 1
+            for (entry_gear, entry_n, entry_signature), value in self.entries.items():
+                if entry_gear != gear or entry_n != points_n:
+                    continue
+                distance = np.max(np.abs(np.subtract(entry_signature, signature)))
+                if distance < best_distance:
+                    best_distance = distance
+                    entry = value
+        if entry is None:
+            return None
+
+        # move the cached trajectory to the start, the error at the goal is
+        # distributed linearly along the trajectory
+        seed = entry['path'].copy()
+        seed[:, :2] += path[0, :2]
+        ratio = np.linspace(0, 1, points_n)
+        for k in [0, 1, 2]:
+            seed[:, k] += (seed[0, k] - path[0, k]) * (ratio - 1) - \
+                (seed[-1, k] - path[-1, k]) * ratio
+        return {'path': seed,
+                'tf': entry['tf'],
+                'lam_x': entry['lam_x'],
+                'lam_g': entry['lam_g'],
+                'exact': exact}
+
+    def insert(self, path: np.array, solution: np.array, tf: float,
+               lam_x: np.array = None, lam_g: np.array = None):
+        '''
+        description: store the solution of the segment
+        param {np.array} path: the initial guess, used for the signature
+        param {np.array} solution: [[x,y,theta,v,a,sigma,omega],...] the ocp solution
+        param {float} tf: the time of the solution
+        param lam_x, lam_g: the multipliers of the bounds and the constraints
+        '''
+        if not math.isfinite(tf):
+            return
+        key = self.signature(path)
+        relative = np.array(solution, dtype=np.float64)
+        relative[:, :2] -= relative[0, :2]
+        self.entries.pop(key, None)
+        self.entries[key] = {'path': relative,
+                             'tf': tf,
+                             'lam_x': lam_x,
+                             'lam_g': lam_g}
+        self.new_keys.add(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
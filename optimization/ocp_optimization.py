@@ -13,15 +13,35 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 from __future__ import division
 from map.costmap import Map, Vehicle
 import math
-from path_plan import rs_curve
+from instrumentation.profiler import profiler
+from optimization.corridor import corridor
+from optimization.ocp_cache import ocp_cache
+from util_math.trajectory import Trajectory, as_trajectory
 import numpy as np
+import os
+import tempfile
 
-import pyomo.environ as pyo
 solver_path = 'optimization/ipopt'
 
 # wheel base
 Lw = 2.8
 
+# the variables of each point, the same order as the trajectory
+STATE_NAMES = ['x', 'y', 'theta', 'v', 'a', 'sigma', 'omega']
+
+
+def read_ipopt_iterations(log_file: str) -> int:
+    '''
+    return the iteration number reported in the ipopt log, 0 if not found
+    '''
+    if not os.path.exists(log_file):
+        return 0
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('Number of Iterations'):
+                return int(line.split(':')[-1])
+    return 0
+
 
 class ocp_optimization:
     def __init__(self,
@@ -32,645 +52,361 @@ class ocp_optimization:
         self.map = park_map
         self.vehicle = vehicle
         self.expand_dis = config['expand_dis']  # m
+        # ocp models and solvers of each horizon length
+        self.models = dict()
+        self.casadi_solvers = dict()
+        # print the solver status of each segment
+        self.verbose = config.get('ocp_verbose', False)
+        # the ocp of the last solution converged or not
+        self.last_success = None
+        # solutions of the solved segments, used to warm start the ocp, the
+        # ipopt executable of the pyomo backend can not start from the cached
+        # multipliers, so the warm start requires the casadi backend
+        self.cache = None
+        if config.get('ocp_warm_start', False):
+            if config.get('ocp_backend', 'pyomo') != 'casadi':
+                raise Exception("ocp_warm_start requires ocp_backend: casadi")
+            self.cache = ocp_cache(config)
+
+    def save_cache(self):
+        '''
+        write the cache file once at the end of a run if ocp_cache_persist is True
+        '''
+        if self.cache is not None:
+            self.cache.save()
 
     def compute_collision_H(self, path):
         '''
         use AABB block to find those map points near the vehicle
         and then find the shortest distance from these points to
-        the vehicle square. noted as [f_d, b_d, r_d, l_d]
-        f_d is the shortest distance from obstacles to the front edge
-        b_d is to the rear edge, and r_d is to the right edge, l_d is
-        to the left edge.
-        [E;-E] X <= [H_max;-H_min]
+        the vehicle square, see optimization/corridor.py
         return: x_max, y_max, x_min, y_min
         '''
+        X_max, Y_max, X_min, Y_min = corridor.compute_bound(
+            path, self.map, self.vehicle, self.config, self.expand_dis)
+        return X_max.tolist(), Y_max.tolist(), X_min.tolist(), Y_min.tolist()
 
-        # get near obstacles and vehicle
-        def get_near_obstacles(node_x, node_y, theta, map: Map, config):
-            '''
-            this function is only used for distance check method
-            return the obstacles x and y, vehicle boundary
-            Note: vehicle boundary is expanded
-            '''
-
-            # create vehicle boundary
-            v = Vehicle()
-
-            # create_polygon
-            vehicle_boundary = v.create_anticlockpoint(
-                x=node_x, y=node_y, theta=theta, config=config)
-
-            '''
-            right_rear = vehicle_boundary[0]
-            right_front = vehicle_boundary[1]
-            left_front = vehicle_boundary[2]
-            left_rear = vehicle_boundary[3]
-            note: these points have expanded
-            '''
-
-            # create AABB squaref
-            x_max = max(vehicle_boundary[:, 0]) + self.expand_dis
-            x_min = min(vehicle_boundary[:, 0]) - self.expand_dis
-            y_max = max(vehicle_boundary[:, 1]) + self.expand_dis
-            y_min = min(vehicle_boundary[:, 1]) - self.expand_dis
-
-            # get obstacle position
-            obstacle_index = np.where(map.cost_map == 255)
-            obstacle_position_x = map.map_position[0][obstacle_index[0]]
-            obstacle_position_y = map.map_position[1][obstacle_index[1]]
-
-            # find those obstacles point in the AABB square
-            near_x_position = obstacle_position_x[np.where(
-                (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-            near_y_position = obstacle_position_y[np.where(
-                (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-
-            # determine y
-            near_obstacle_x = near_x_position[np.where(
-                (near_y_position >= y_min) & (near_y_position <= y_max))]
-            near_obstacle_y = near_y_position[np.where(
-                (near_y_position >= y_min) & (near_y_position <= y_max))]
-
-            near_obstacle_range = [near_obstacle_x, near_obstacle_y]
-
-            return near_obstacle_range, vehicle_boundary
-
-        # compute the parameters of boundary line
-        def compute_k_b(point_1, point_2):
-            # k = (y_2 - y_1) / (x_2 - x_1)
-            k = (point_2[1] - point_1[1]) / (point_2[0] - point_1[0])
-            # b = y_1 - k * x_1
-            b = point_1[1] - k * point_1[0]
-            b_2 = point_2[1] - k * point_2[0]
-            return k, b
-
-        def get_area_boundary(point1, point2):
-            area_x_min = min(point1[0], point2[0])
-            area_x_max = max(point1[0], point2[0])
-            area_y_min = min(point1[1], point2[1])
-            area_y_max = max(point1[1], point2[1])
-            return [area_x_min, area_x_max, area_y_min, area_y_max]
-
-        def compute_distance(_k, _b, point):
-            dis = abs(_k * point[0] + _b - point[1]) / np.sqrt(1+pow(_k, 2))
-            return dis
-
-        # compute the distance from the point to the line
-        def compute_hori_ver_dis(point, k, b, theta):
-            shortest_dis = compute_distance(_k=k, _b=b, point=point)
-            vertical_dis = shortest_dis / abs(np.cos(theta))
-            horizon_dis = shortest_dis / abs(np.sin(theta))
-            return float(horizon_dis), float(vertical_dis)
-
-        original_path = path
-        X_max = []
-        Y_max = []
-        X_min = []
-        Y_min = []
-        # create AABB boundary and get the near obstacles position
-        for p in original_path:
-            x, y, theta = p[0], p[1], rs_curve.pi_2_pi(p[2])
-            near_obstacles_range, vehicle_boundary = get_near_obstacles(node_x=x, node_y=y,
-                                                                        theta=theta, map=self.map, config=self.config)
-            # compute k and b
-            '''
-            0: right line
-            1: front line
-            2: left line
-            3: rear line
-            '''
-            line_k = []
-            line_b = []
-            for i in range(4):
-                if i < 3:
-                    k_i, b_i = compute_k_b(
-                        vehicle_boundary[i], vehicle_boundary[i+1])
-                    line_k.append(k_i)
-                    line_b.append(b_i)
-                else:
-                    k_i, b_i = compute_k_b(
-                        vehicle_boundary[i], vehicle_boundary[0])
-                    line_k.append(k_i)
-                    line_b.append(b_i)
-
-            near_obstacle_x = near_obstacles_range[0]
-            near_obstacle_y = near_obstacles_range[1]
-
-            # compute the obstacles points in which area
-            # there are four situations about the car heading
-            if theta >= -math.pi and theta < -math.pi / 2:
-                case = 3
-            elif theta >= -math.pi/2 and theta < 0:
-                case = 4
-            elif theta >= 0 and theta < math.pi / 2:
-                case = 1
-            elif theta >= math.pi/2 and theta <= math.pi:
-                case = 2
-
-            x_min, x_max = self.expand_dis, self.expand_dis
-            y_min, y_max = self.expand_dis, self.expand_dis
-            # compute each the boundary of each area
-            each_area_boundary = []
-            '''
-            right area --- 0
-            front area --- 1
-            left area --- 2
-            rear area --- 3
-            '''
-            for i in range(4):
-                if i < 3:
-                    _area = get_area_boundary(
-                        vehicle_boundary[i], vehicle_boundary[i+1])
-                else:
-                    _area = get_area_boundary(
-                        vehicle_boundary[i], vehicle_boundary[0])
-
-                each_area_boundary.append(_area)
-
-            # total 4 cases and four areas in each case to compute x,y boundary
-            # theta is in [0, pi/2)
-            if case == 1:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        k += 1
-            # theta is in [pi/2, pi]
-            elif case == 2:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        k += 1
-            # theta is in [-pi, -pi/2)
-            elif case == 3:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        k += 1
-            # theta is in [-pi/2, 0)
-            elif case == 4:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        k += 1
-
-            X_max.append(x_max+x)
-            Y_max.append(y_max+y)
-            X_min.append(x-x_min)
-            Y_min.append(y-y_min)
-
-        # X_max_matrix = np.array(X_max).reshape(len(X_max), 1)
-        # Y_max_matrix = np.array(Y_max).reshape(len(Y_max), 1)
-        # X_min_matrix = np.array(X_min).reshape(len(X_min), 1)
-        # Y_min_matrix = np.array(Y_min).reshape(len(Y_min), 1)
-        # H_collision_matrix = np.vstack((H_max_matrix, -H_min_matrix))
-        # slack_H_collision_matrix = np.vstack((H_max_matrix, 999*np.ones((points_n-2, 1)),
-        #                                       -H_min_matrix, np.zeros((points_n-2, 1))))
-
-        return X_max, Y_max, X_min, Y_min
-
-    def solution(self, path: list):
+    def build_model(self, points_n: int):
         '''
-        input: path is a list, [[x,y,theta,v,a,sigma,omega,t],[x,y...],...,[x,y...]]
+        description: build the ocp model of the horizon length, the position
+        bounds, the fixed boundary states and the final heading are mutable
+        parameters, so the model is built once and updated for each path
+        states over the time set: x, y, theta, v, sigma
+        controls over the time set: a, omega
+        the time of the trajectory: tf
         '''
+        import pyomo.environ as pyo
+
         # create a model
         model = pyo.ConcreteModel()
+        model.time = pyo.RangeSet(0, points_n-1)
+        # the steps of the dynamics, from time t-1 to time t
+        model.step = pyo.RangeSet(1, points_n-1)
+        model.state = pyo.Set(initialize=['x', 'y', 'theta', 'v', 'sigma'])
+        small_v = 0.0001  # m/s
+
+        # position bounds and the final heading
+        model.x_min = pyo.Param(model.time, mutable=True, initialize=0)
+        model.x_max = pyo.Param(model.time, mutable=True, initialize=0)
+        model.y_min = pyo.Param(model.time, mutable=True, initialize=0)
+        model.y_max = pyo.Param(model.time, mutable=True, initialize=0)
+        model.final_pose_sin = pyo.Param(mutable=True, initialize=0)
+        model.final_pose_cos = pyo.Param(mutable=True, initialize=1)
+
+        model.x = pyo.Var(model.time, bounds=lambda m, t: (m.x_min[t], m.x_max[t]))
+        model.y = pyo.Var(model.time, bounds=lambda m, t: (m.y_min[t], m.y_max[t]))
+        model.theta = pyo.Var(model.time, bounds=(-3.1415926, 3.1415926))
+        model.v = pyo.Var(model.time,
+                          bounds=lambda m, t: (0, small_v) if t == 0 else (-2.5, 2.5))
+        model.a = pyo.Var(model.time, bounds=(-1, 1))
+        model.sigma = pyo.Var(model.time, bounds=(-0.75, 0.75))
+        model.omega = pyo.Var(model.time, bounds=(-0.5, 0.5))
+        model.tf = pyo.Var(bounds=(0, 200))
+
+        # the objective funtion is min: t + a^2+w^2+v^2 + \sigma^2
+        model.obj1 = pyo.Objective(
+            expr=self.config['cost_time'] * model.tf +
+            sum(self.config['cost_acceleration'] * model.a[t] ** 2 +
+                self.config['cost_velocity'] * model.v[t] ** 2 +
+                self.config['cost_steering_angle'] * model.sigma[t] ** 2 +
+                self.config['cost_omega'] * model.omega[t] ** 2 for t in model.time),
+            sense=pyo.minimize)
+
+        def dynamics(model, state, t):
+            dt = model.tf / (points_n - 1)
+            theta = model.theta[t-1]
+            if state == 'x':
+                # delta_x = delta_s * pyo.cos(theta)
+                delta = model.v[t-1] * dt * (1 - (1/2) * theta ** 2)
+            elif state == 'y':
+                # delta_y = delta_s * pyo.sin(theta)
+                delta = model.v[t-1] * dt * (theta - (1/6) * theta ** 3)
+            elif state == 'theta':
+                # delta_theta = delta_s * pyo.tan(sigma) / Lw
+                delta = model.v[t-1] * dt * \
+                    (model.sigma[t-1] + (1/3) * model.sigma[t-1] ** 3) / Lw
+            elif state == 'v':
+                delta = model.a[t-1] * dt
+            else:
+                delta = model.omega[t-1] * dt
+            variable = getattr(model, state)
+            return variable[t] == variable[t-1] + delta
+        model.eq_kinematic = pyo.Constraint(model.state, model.step, rule=dynamics)
 
-        # define the initial solution
-        initial_path = np.array(path)[:, :-1]
-        tf_initial = path[-1][-1]
+        model.final_theta1 = pyo.Constraint(
+            expr=pyo.sin(model.theta[points_n-1]) == model.final_pose_sin)
+        model.final_theta2 = pyo.Constraint(
+            expr=pyo.cos(model.theta[points_n-1]) == model.final_pose_cos)
+
+        return model
+
+    def get_model(self, points_n: int):
         '''
-        initial_solution: [x_1,y_1,theta_1,v_1,a_1,
-            sigma_1,omega_1,x_2,y_2,...,omega_n,tf]
+        return: the cached model of this horizon length and its solver
         '''
-        initial_solution = np.append(initial_path, tf_initial)
-        # check the input is feasible
-        for i in range(len(initial_solution)):
-            # velocity
-            if (i-3) % 7 == 0:
-                if (initial_solution[i] > 2.5):
-                    initial_solution[i] = 2.5
-                elif (initial_solution[i] < -2.5):
-                    initial_solution[i] = -2.5
-            elif (i-4) % 7 == 0:
-                if (initial_solution[i] > 1):
-                    initial_solution[i] = 1
-                elif (initial_solution[i] < -1):
-                    initial_solution[i] = -1
-            elif (i-5) % 7 == 0:
-                if (initial_solution[i] > 0.75):
-                    initial_solution[i] = 0.75
-                elif (initial_solution[i] < -0.75):
-                    initial_solution[i] = -0.75
-            elif (i-6) % 7 == 0:
-                if (initial_solution[i] > 0.5):
-                    initial_solution[i] = 0.5
-                elif (initial_solution[i] < -0.5):
-                    initial_solution[i] = -0.5
-        
-        variable_n = len(initial_solution)
-        points_n = int((variable_n - 1) / 7)
-        final_pose_sin = math.sin(initial_solution[-6])
-        final_pose_cos = math.cos(initial_solution[-6])
-
-        model.index_x = pyo.RangeSet(0, variable_n-1, 1)
-        x = np.linspace(0, variable_n-1, variable_n, dtype=np.int32)
-
-        def initial_x(model, i):
-            model.variables[i] = initial_solution[int(i)]
-            return model.variables[i]
+        if points_n not in self.models:
+            self.models[points_n] = (self.build_model(points_n), self.create_solver())
+        return self.models[points_n]
 
-        # get collision bounds
-        x_max, y_max, x_min, y_min = self.compute_collision_H(path=path)
-        small_v = 0.0001  # m/s
+    @staticmethod
+    def create_solver():
+        '''
+        use the persistent ipopt interface (appsi) if it is available, it only
+        updates the changed parameters of the model between solves
+        '''
+        import pyomo.environ as pyo
+        try:
+            from pyomo.common.fileutils import Executable
+            from pyomo.contrib.appsi.solvers import Ipopt
+            solver = Ipopt()
+            solver.config.executable = Executable(solver_path)
+            solver.config.load_solution = False
+            if solver.available():
+                solver.ipopt_options['max_iter'] = 1000
+                return solver
+        except ImportError:
+            pass
+        solver = pyo.SolverFactory(
+            'ipopt', executable=solver_path)  # 指定 ipopt 作为求解器
+        solver.options['max_iter'] = 1000
+        return solver
 
-        def bound(model, i):
-            i = int(i)
-            if (i-0) % 7 == 0 and i < (variable_n-1):
-                k = int((i-0) / 7)
-                x_bounds = (x_min[k], x_max[k])
-                return x_bounds
-            elif (i-1) % 7 == 0 and i < (variable_n-1):
-                k = int((i-1) / 7)
-                y_bounds = (y_min[k], y_max[k])
-                return y_bounds
-            elif (i-2) % 7 == 0:
-                theta_bounds = (-3.1415926, 3.1415926)
-                return theta_bounds
-            elif (i-3) % 7 == 0:
-                if i == 3:
-                    v_bounds = (0, small_v)
-                else:
-                    v_bounds = (-2.5, 2.5)
-                return v_bounds
-            elif (i-4) % 7 == 0:
-                a_bounds = (-1, 1)
-                return a_bounds
-            elif (i-5) % 7 == 0:
-                sigma_bounds = (-0.75, 0.75)
-                return sigma_bounds
-            elif (i-6) % 7 == 0:
-                omega_bounds = (-0.5, 0.5)
-                return omega_bounds
-            elif i == (variable_n-1):
-                tf_bounds = (0, 200)
-                return tf_bounds
-
-        model.variables = pyo.Var(x, within=pyo.Reals,
-                                  initialize=initial_x, bounds=bound)
+    def build_casadi_solver(self, points_n: int, warm_start: bool = False):
+        '''
+        description: build the ocp of the horizon length with casadi, the
+        derivatives are generated by automatic differentiation and ipopt is
+        called in process. the bounds fix the start and goal states and the
+        parameters are the sin and cos of the final heading
+        variables: [x_1..x_n, y_1..y_n, theta, v, a, sigma, omega, tf]
+        param {bool} warm_start: ipopt starts from the given multipliers
+        '''
+        # import casadi only when this backend is used
+        import casadi
+
+        w = casadi.SX.sym('w', 7 * points_n + 1)
+        x, y, theta, v, a, sigma, omega = [w[k*points_n:(k+1)*points_n] for k in range(7)]
+        tf = w[-1]
+        final_pose = casadi.SX.sym('final_pose', 2)
+        dt = tf / (points_n - 1)
+
+        # the objective funtion is min: t + a^2+w^2+v^2 + \sigma^2
+        objective = self.config['cost_time'] * tf + \
+            self.config['cost_acceleration'] * casadi.sumsqr(a) + \
+            self.config['cost_velocity'] * casadi.sumsqr(v) + \
+            self.config['cost_steering_angle'] * casadi.sumsqr(sigma) + \
+            self.config['cost_omega'] * casadi.sumsqr(omega)
+
+        # dynamics from time t-1 to time t, the same as the pyomo model
+        theta_0, v_0, sigma_0 = theta[:-1], v[:-1], sigma[:-1]
+        constraints = casadi.vertcat(
+            x[1:] - x[:-1] - v_0 * dt * (1 - (1/2) * theta_0 ** 2),
+            y[1:] - y[:-1] - v_0 * dt * (theta_0 - (1/6) * theta_0 ** 3),
+            theta[1:] - theta[:-1] - v_0 * dt * (sigma_0 + (1/3) * sigma_0 ** 3) / Lw,
+            v[1:] - v[:-1] - a[:-1] * dt,
+            sigma[1:] - sigma[:-1] - omega[:-1] * dt,
+            casadi.sin(theta[-1]) - final_pose[0],
+            casadi.cos(theta[-1]) - final_pose[1])
+
+        options = {'print_time': False,
+                   'ipopt.max_iter': 1000,
+                   'ipopt.print_level': 0,
+                   'ipopt.sb': 'yes'}
+        if warm_start:
+            options.update({'ipopt.warm_start_init_point': 'yes',
+                            'ipopt.warm_start_bound_push': 1e-6,
+                            'ipopt.warm_start_mult_bound_push': 1e-6,
+                            'ipopt.mu_init': 1e-4})
+        return casadi.nlpsol('ocp', 'ipopt',
+                             {'x': w, 'p': final_pose, 'f': objective, 'g': constraints},
+                             options)
+
+    def solve_casadi(self, initial_path: np.array, tf_initial: float, bounds, warm_start=None):
+        '''
+        param warm_start: the multipliers lam_x and lam_g of a similar solution
+        return: path: [[x,y,theta,v,a,sigma,omega],...] of the solution, tf,
+                lam_x, lam_g: the multipliers, success
+        '''
+        points_n = len(initial_path)
+        dual_start = warm_start is not None and warm_start['lam_x'] is not None
+        if (points_n, dual_start) not in self.casadi_solvers:
+            self.casadi_solvers[points_n, dual_start] = self.build_casadi_solver(
+                points_n, warm_start=dual_start)
+        solver = self.casadi_solvers[points_n, dual_start]
+        x_max, y_max, x_min, y_min = bounds
+        small_v = 0.0001  # m/s
 
+        # bounds of [x, y, theta, v, a, sigma, omega] of each point
+        lower_bound = np.tile([0, 0, -3.1415926, -2.5, -1, -0.75, -0.5], (points_n, 1))
+        upper_bound = np.tile([0, 0, 3.1415926, 2.5, 1, 0.75, 0.5], (points_n, 1))
+        lower_bound[:, 0], upper_bound[:, 0] = x_min, x_max
+        lower_bound[:, 1], upper_bound[:, 1] = y_min, y_max
+        lower_bound[0, 3], upper_bound[0, 3] = 0, small_v
         # fix the initial pose and the goal pose
-        model.variables[0].fix(initial_solution[0])
-        model.variables[1].fix(initial_solution[1])
-        model.variables[2].fix(initial_solution[2])
-        model.variables[variable_n-8].fix(initial_solution[-8])
-        model.variables[variable_n-7].fix(initial_solution[-7])
-        model.variables[variable_n-6].fix(initial_solution[-6])
-        model.variables[variable_n-5].fix(0)
-        model.variables[variable_n-4].fix(0)
-        model.variables[variable_n-2].fix(0)
-
-    
-
-        def objective(model):
-            '''
-            the objective funtion is min: t + a^2+w^2+v^2 + \sigma^2
-            input: x, y, theta, v, a, delta, w, ..., tf
-            '''
-            expr = 0
-            expr = self.config['cost_time'] * model.variables[variable_n-1]
-            # print(len(model.variables))
-            for i in range(variable_n):
-                if (i-4) % 7 == 0:
-                    expr += self.config['cost_acceleration'] * \
-                        model.variables[i] ** 2
-                elif (i-3) % 7 == 0:
-                    expr += self.config['cost_velocity'] * \
-                        model.variables[i] ** 2
-                elif (i-5) % 7 == 0:
-                    expr += self.config['cost_steering_angle'] * \
-                        model.variables[i] ** 2
-                elif (i-6) % 7 == 0:
-                    expr += self.config['cost_omega'] * model.variables[i] ** 2
-            return expr
-
-        model.obj1 = pyo.Objective(rule=objective, sense=pyo.minimize)
-
-        def kinematic_constraint(model, i):
-            if i < 7:
-                return pyo.Constraint.Skip
-            elif i % 7 == 0:
-                delta_s = model.variables[i-4] * model.variables[variable_n-1] / (points_n - 1)
-                # delta_x = delta_s * pyo.cos(model.variables[i-5])
-                delta_x = delta_s * (1- (1/2) * model.variables[i-5] ** 2)
-                # return abs(model.variables[i] - model.variables[i-7] - delta_x) <= 1e-6
-                return model.variables[i] == model.variables[i-7] + delta_x
-            elif (i-1) % 7 == 0:
-                delta_s = model.variables[i-5] * model.variables[variable_n-1] / (points_n - 1)
-                # delta_y = delta_s * pyo.sin(model.variables[i-6])
-                delta_y = delta_s * (model.variables[i-6] - (1/6) * model.variables[i-6] ** 3)
-                return model.variables[i] == model.variables[i-7] + delta_y
-            elif (i-2) % 7 == 0:
-                delta_s = model.variables[i-6] * model.variables[variable_n-1] / (points_n - 1)
-                # delta_theta = delta_s * pyo.tan(model.variables[i-4]) / Lw
-                delta_theta =delta_s * (model.variables[i-4] + (1/3) * model.variables[i-4] ** 3) / Lw
-                return model.variables[i] == model.variables[i-7] + delta_theta
-            elif (i-3) % 7 == 0:
-                delta_v = model.variables[i-6] * model.variables[variable_n-1] / (points_n - 1)
-                return model.variables[i] == model.variables[i-7] + delta_v
-            elif (i-5) % 7 == 0:
-                delta_sigma = model.variables[i-6] * model.variables[variable_n-1] / (points_n - 1)
-                return model.variables[i] == model.variables[i-7] + delta_sigma
-            else:
-                return pyo.Constraint.Skip
-        model.eq_kinematic = pyo.Constraint(
-            model.index_x, rule=kinematic_constraint)
+        for k in [0, 1, 2]:
+            lower_bound[0, k] = upper_bound[0, k] = initial_path[0, k]
+            lower_bound[-1, k] = upper_bound[-1, k] = initial_path[-1, k]
+        for k in [3, 4, 6]:
+            lower_bound[-1, k] = upper_bound[-1, k] = 0
+
+        arguments = {'x0': np.append(initial_path.transpose().flatten(), tf_initial),
+                     'p': [math.sin(initial_path[-1, 2]), math.cos(initial_path[-1, 2])],
+                     'lbx': np.append(lower_bound.transpose().flatten(), 0),
+                     'ubx': np.append(upper_bound.transpose().flatten(), 200),
+                     'lbg': 0,
+                     'ubg': 0}
+        if dual_start:
+            arguments['lam_x0'] = warm_start['lam_x']
+            arguments['lam_g0'] = warm_start['lam_g']
+        result = solver(**arguments)
+        stats = solver.stats()
+        profiler.count('nlp_iterations', stats['iter_count'])
+        if self.verbose:
+            print('ocp termination condition:', stats['return_status'])
+            print('minimum value', float(result['f']))
+
+        solution = result['x'].full().flatten()
+        return {'path': solution[:-1].reshape(7, points_n).transpose(),
+                'tf': solution[-1],
+                'lam_x': result['lam_x'].full().flatten(),
+                'lam_g': result['lam_g'].full().flatten(),
+                'success': stats['success']}
+
+    def solve_pyomo(self, initial_path: np.array, tf_initial: float, bounds):
+        '''
+        description: the ipopt executable starts from initial_path and tf_initial
+        return: path: [[x,y,theta,v,a,sigma,omega],...] of the solution, tf,
+                lam_x, lam_g: None, success
+        '''
+        # import pyomo only when the ocp problem is solved
+        import pyomo.environ as pyo
+
+        points_n = len(initial_path)
+        model, solver = self.get_model(points_n)
+        x_max, y_max, x_min, y_min = bounds
+
+        # update the parameters and the initial solution
+        for t in range(points_n):
+            model.x_min[t], model.x_max[t] = x_min[t], x_max[t]
+            model.y_min[t], model.y_max[t] = y_min[t], y_max[t]
+            for k, name in enumerate(STATE_NAMES):
+                getattr(model, name)[t].set_value(initial_path[t, k], skip_validation=True)
+        model.tf.set_value(tf_initial, skip_validation=True)
+        model.final_pose_sin = math.sin(initial_path[-1, 2])
+        model.final_pose_cos = math.cos(initial_path[-1, 2])
 
-        model.final_theta1 = pyo.Constraint(expr=pyo.sin(
-            model.variables[variable_n-6]) == final_pose_sin)
-        model.final_theta2 = pyo.Constraint(expr=pyo.cos(
-            model.variables[variable_n-6]) == final_pose_cos)
+        # fix the initial pose and the goal pose
+        end = points_n - 1
+        for name, k in [('x', 0), ('y', 1), ('theta', 2)]:
+            getattr(model, name)[0].fix(initial_path[0, k])
+            getattr(model, name)[end].fix(initial_path[end, k])
+        model.v[end].fix(0)
+        model.a[end].fix(0)
+        model.omega[end].fix(0)
 
         # solution
-        model.variables.pprint()
-        model.obj1.pprint()
-        solver = pyo.SolverFactory(
-        'ipopt', executable=solver_path)  # 指定 ipopt 作为求解器
-        # solver = pyo.SolverFactory('ipopt')
-        solver.options['max_iter'] == 1000
-        solution = solver.solve(model)
-        solution.write()
-
-        optimal_tf = pyo.value(model.variables[variable_n-1])
-        optimal_dt = optimal_tf / (points_n-1)
-        optimal_traj = []
-        points = []
-
-        for index in range(variable_n-1):
-            if index % 7 == 0 and index > 0:
-                optimal_traj.append(points)
-                points = []
-            if (index-2) % 7 == 0:
-                _theta = rs_curve.pi_2_pi(pyo.value(model.variables[index]))
-                points.append(_theta)
-            else:
-                points.append(pyo.value(model.variables[index]))
-            # print('solution', index)
-            # print(pyo.value(model.variables[index]))
+        log_file = os.path.join(tempfile.gettempdir(),
+                                'ipopt_%d.log' % os.getpid())
+        if hasattr(solver, 'ipopt_options'):
+            solver.ipopt_options['output_file'] = log_file
+            results = solver.solve(model)
+            if results.best_feasible_objective is not None:
+                results.solution_loader.load_vars()
+            if self.verbose:
+                print('ocp termination condition:', results.termination_condition)
+            success = results.termination_condition.name == 'optimal'
+        else:
+            solution = solver.solve(model, logfile=log_file)
+            if self.verbose:
+                solution.write()
+            success = pyo.check_optimal_termination(solution)
+        profiler.count('nlp_iterations', read_ipopt_iterations(log_file))
+        if self.verbose:
+            print('minimum value', pyo.value(model.obj1))
+
+        solution_path = np.array([[pyo.value(getattr(model, name)[t]) for name in STATE_NAMES]
+                                  for t in range(points_n)])
+        return {'path': solution_path,
+                'tf': pyo.value(model.tf),
+                'lam_x': None,
+                'lam_g': None,
+                'success': success}
+
+    def solution(self, path: Trajectory):
+        '''
+        input: path is a Trajectory or a list, [[x,y,theta,v,a,sigma,omega,t],[x,y...],...,[x,y...]]
+        the ocp is solved by the backend set by ocp_backend in config
+        return: the Trajectory of the solution, t is the time from the start
+        of the segment, the optimal tf and dt. self.last_success is False if
+        the solver did not converge, then the trajectory is not optimal and
+        may be the initial guess
+        '''
+        path = as_trajectory(path)
+        # define the initial solution, [x,y,theta,v,a,sigma,omega] of each point
+        initial_path = path.data[:, :-1].copy()
+        tf_initial = path['t'][-1]
+        # check the input is feasible, v, a, sigma, omega
+        initial_path[:, 3] = np.clip(initial_path[:, 3], -2.5, 2.5)
+        initial_path[:, 4] = np.clip(initial_path[:, 4], -1, 1)
+        initial_path[:, 5] = np.clip(initial_path[:, 5], -0.75, 0.75)
+        initial_path[:, 6] = np.clip(initial_path[:, 6], -0.5, 0.5)
+        points_n = len(initial_path)
 
-        optimal_traj.append(points)
+        # get collision bounds
+        bounds = self.compute_collision_H(path=path)
+
+        # warm start from the cached solution of a similar segment
+        initial_guess, tf_guess, warm_start = initial_path, tf_initial, None
+        if self.cache is not None:
+            warm_start = self.cache.query(initial_path)
+            if warm_start is not None:
+                initial_guess, tf_guess = warm_start['path'], warm_start['tf']
+                profiler.count('ocp_cache_hits')
+
+        backend = self.config.get('ocp_backend', 'pyomo')
+        if backend == 'pyomo':
+            result = self.solve_pyomo(initial_guess, tf_guess, bounds)
+        elif backend == 'casadi':
+            result = self.solve_casadi(initial_guess, tf_guess, bounds, warm_start)
+        else:
+            raise Exception("the ocp backend is not defined")
+        solution_path, optimal_tf = result['path'], result['tf']
+        if self.cache is not None and result['success']:
+            self.cache.insert(initial_path, solution_path, optimal_tf,
+                              lam_x=result['lam_x'], lam_g=result['lam_g'])
 
-        print('solved ocp problem')
-        print('minimum value', pyo.value(model.obj1))
+        optimal_dt = optimal_tf / (points_n-1)
+        optimal_traj = Trajectory.empty(points_n)
+        optimal_traj.data[:, :-1] = solution_path
+        # theta in [-pi, pi], the same as pi_2_pi in path_plan/rs_curve.py
+        theta = optimal_traj['theta']
+        theta -= 2 * np.pi * np.ceil((theta - np.pi) / (2 * np.pi))
+        optimal_traj['t'][:] = optimal_dt * np.arange(points_n)
+
+        self.last_success = result['success']
+        if not result['success']:
+            profiler.count('ocp_failures')
+        if self.verbose:
+            print('solved ocp problem' if result['success'] else
+                  'the ocp solver did not converge, the trajectory is not optimal')
 
         return optimal_traj, optimal_tf, optimal_dt
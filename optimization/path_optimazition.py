@@ -10,12 +10,15 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 '''
 
 
-from typing import List
+from typing import Tuple
 import numpy as np
 import math
-from cvxopt import matrix, solvers
 from map.costmap import Map, Vehicle
-import scipy.spatial as spatial
+import scipy.sparse as sparse
+from instrumentation.profiler import profiler
+from optimization.qp_solver import create_qp_solver, cvxopt_solver
+from optimization.corridor import corridor
+from util_math.trajectory import Trajectory, PATH_COLUMNS, as_trajectory
 
 
 class path_opti:
@@ -29,64 +32,54 @@ class path_opti:
         self.matrix_dict = dict()
         self.expand_dis = config['expand_dis']  # m
         self.config = config
+        # qp backend, see optimization/qp_solver.py
+        self.qp_solver = create_qp_solver(config)
+        # the interior point solver used when the backend does not converge
+        self.fallback_solver = None
+        self.qp_result = None
+        # False if the last qp did not converge even with the fallback solver
+        self.last_success = True
+
+    @staticmethod
+    def difference_matrix(points_n: int, order: int):
+        '''
+        description: the sparse difference operator of the stacked points
+                     X = [x_1,y_1,x_2,y_2,...,x_n,y_n]
+        order 1: row i is X_(i+1) - X_i
+        order 2: row i is X_i - 2X_(i+1) + X_(i+2)
+        return {*} scipy sparse matrix, shape is (2*(n-order), 2*n)
+        '''
+        if points_n <= order:
+            return sparse.csc_matrix((0, 2*points_n))
+        if order == 1:
+            coffecient, offsets = [-1, 1], [0, 1]
+        else:
+            coffecient, offsets = [1, -2, 1], [0, 1, 2]
+        difference = sparse.diags(coffecient, offsets,
+                                  shape=(points_n-order, points_n))
+        return sparse.kron(difference, sparse.identity(2), format='csc')
 
     def formate_matrix(self,
-                       path: list) -> np.array:
+                       path: Trajectory) -> np.array:
         '''
         QP objective function form: 1/2 X^T P X + Q^T X
         subject to: GX <= H
                     AX = B
+        P, A and G are scipy sparse matrices, the others are dense arrays
         '''
-        self.original_path = path
+        self.original_path = as_trajectory(path, PATH_COLUMNS)
         points_n = len(self.original_path)
-        # compute the path smooth function
-        smooth_matrix = np.zeros((2*points_n, 2*points_n))
-        if points_n > 2:
-            for i in range(points_n-2):
-                # create left upper original matrix
-                zero_matrix_1 = np.zeros((2*i, 2*i))
-                # create coffecient matrix
-                eye_matrix = np.eye(2)
-                coffecient_1 = np.hstack(
-                    (eye_matrix, -2*eye_matrix, eye_matrix))
-                coffecient_2 = np.hstack(
-                    (-2*eye_matrix, 4*eye_matrix, -2*eye_matrix))
-                coffecient = np.vstack(
-                    (coffecient_1, coffecient_2, coffecient_1))
-                # create right down original matrix
-                zero_matrix_2 = np.zeros((2*(points_n-i-3), 2*(points_n-i-3)))
-                # stack them
-                first_row_matrix = np.hstack(
-                    (zero_matrix_1, np.zeros((2*i, 2*points_n - 2*i))))
-                second_row_matrix = np.hstack(
-                    (np.zeros((6, 2*i)), coffecient, np.zeros((6, 2*(points_n-i-3)))))
-                third_row_matrix = np.hstack(
-                    (np.zeros((2*(points_n-i-3), 2*i+6)), zero_matrix_2))
-                smooth_matrix = smooth_matrix + \
-                    np.vstack(
-                        (first_row_matrix, second_row_matrix, third_row_matrix))
-
-        # compute the path compaction function
-        compaction_matrix = np.zeros((2*points_n, 2*points_n))
-        for i in range(points_n-1):
-            zero_matrix_1 = np.zeros((2*i, 2*i))
-            coffecient_1 = np.hstack((eye_matrix, -eye_matrix))
-            coffecient_2 = np.hstack((-eye_matrix, eye_matrix))
-            coffecient = np.vstack((coffecient_1, coffecient_2))
-            zero_matrix_2 = np.zeros((2*(points_n-i-2), 2*(points_n-i-2)))
-            # stack
-            first_row_matrix = np.hstack(
-                (zero_matrix_1, np.zeros((2*i, 2*points_n - 2*i))))
-            second_row_matrix = np.hstack(
-                (np.zeros((4, 2*i)), coffecient, np.zeros((4, 2*(points_n-i-2)))))
-            third_row_matrix = np.hstack(
-                (np.zeros((2*(points_n-i-2), 2*i+4)), zero_matrix_2))
-            compaction_matrix = compaction_matrix + \
-                np.vstack(
-                    (first_row_matrix, second_row_matrix, third_row_matrix))
+        slack_n = max(points_n-2, 0)
+        # compute the path smooth function, sum of |X_i - 2X_(i+1) + X_(i+2)|^2
+        smooth_difference = self.difference_matrix(points_n, order=2)
+        smooth_matrix = smooth_difference.transpose() @ smooth_difference
+
+        # compute the path compaction function, sum of |X_(i+1) - X_i|^2
+        compaction_difference = self.difference_matrix(points_n, order=1)
+        compaction_matrix = compaction_difference.transpose() @ compaction_difference
 
         # compute the path offset function
-        path_offset_matrix = np.eye(2*points_n)
+        path_offset_matrix = sparse.identity(2*points_n, format='csc')
         # compute the P matrix
         smooth_weight = self.config['smooth_cost']
         compact_weight = self.config['compact_cost']
@@ -94,57 +87,38 @@ class path_opti:
         slack_weight = self.config['slack_cost']
         P_matrix = 2 * (smooth_weight * smooth_matrix + compact_weight *
                         compaction_matrix + offset_weight * path_offset_matrix)
+        P_matrix = P_matrix.tocsc()
         # compute Q matrix
-        Q = []
-        B = []
-        for i in range(points_n):
-            if i == 0 or i == (points_n-1):
-                B.append(self.original_path[i][0])
-                B.append(self.original_path[i][1])
-            Q.append(self.original_path[i][0])
-            Q.append(self.original_path[i][1])
-
-        Q_matrix = -2 * np.array(Q)
-        Q_matrix = offset_weight * Q_matrix.reshape(len(Q_matrix), 1)
-        slack_Q_matrix = np.vstack((Q_matrix, np.zeros((points_n-2, 1)))) + \
-            np.vstack((np.zeros((2*points_n, 1)),
-                      slack_weight * np.ones((points_n-2, 1))))
-
-        # boundary subject
-        B_matrix = np.array(B)
-        B_matrix = B_matrix.reshape(len(B_matrix), 1)
-        a_1 = np.hstack((eye_matrix, np.zeros((2, 2*points_n-2))))
-        a_2 = np.hstack((np.zeros((2, 2*points_n-2)), eye_matrix))
-        A_matrix = np.vstack((a_1, a_2))
-        slack_A_matrix = np.hstack((A_matrix, np.zeros((4, points_n-2))))
+        position = self.original_path.data[:, :2]
+        Q_matrix = -2 * offset_weight * position.reshape(2*points_n, 1)
+        slack_Q_matrix = np.vstack((Q_matrix, slack_weight * np.ones((slack_n, 1))))
+
+        # boundary subject, fix the start point and the end point
+        B_matrix = position[[0, -1]].reshape(4, 1)
+        A_matrix = sparse.csc_matrix((np.ones(4), ([0, 1, 2, 3],
+                                                   [0, 1, 2*points_n-2, 2*points_n-1])),
+                                     shape=(4, 2*points_n))
+        slack_A_matrix = sparse.hstack(
+            (A_matrix, sparse.csc_matrix((4, slack_n))), format='csc')
         slack_B_matrix = B_matrix
 
         # compute the G and H based on the collision check and curvature limit
-        G_1 = np.eye(2*points_n)
-        G_2 = -np.eye(2*points_n)
-        G_matrix_collision = np.vstack((G_1, G_2))
+        eye_matrix = sparse.identity(2*points_n)
+        G_matrix_collision = sparse.vstack((eye_matrix, -eye_matrix))
         H_matrix_collision, slack_H_matrix_collision = self.compute_collision_H()
 
-        G_matrix_curv, H_matrix_curv = self.compute_curvature_H()
-        slack_G_matrix_curv = np.hstack(
-            (G_matrix_curv, -np.ones((points_n-2, points_n-2))))
-        slack_H_matrix_curv = H_matrix_curv
-        slack_G_matrix_collision = np.vstack(
-            (np.eye(3*points_n-2), -np.eye(3*points_n-2)))
-        G_matrix = np.vstack((G_matrix_collision, G_matrix_curv))
-        H_matrix = np.vstack((H_matrix_collision, H_matrix_curv))
-        slack_G_matrix = np.vstack(
-            (slack_G_matrix_collision, slack_G_matrix_curv))
-        slack_H_matrix = np.vstack(
-            (slack_H_matrix_collision, slack_H_matrix_curv))
+        slack_eye_matrix = sparse.identity(2*points_n+slack_n)
+        slack_G_matrix_collision = sparse.vstack(
+            (slack_eye_matrix, -slack_eye_matrix))
+        # the collision constraints do not change in the sqp iterations
+        self.collision_matrix_dict = {'G': G_matrix_collision, 'H': H_matrix_collision,
+                                      'slack_G': slack_G_matrix_collision,
+                                      'slack_H': slack_H_matrix_collision}
+        G_matrix, H_matrix, slack_G_matrix, slack_H_matrix = self.stack_curvature_constraint()
 
         # if we consider the slack variable
-        zero_matrix = np.zeros((points_n-2, points_n-2))
-        P_first_row = np.hstack(
-            (P_matrix, np.zeros((P_matrix.shape[0], points_n-2))))
-        P_second_row = np.hstack(
-            (np.zeros((points_n-2, P_matrix.shape[1])), zero_matrix))
-        slack_P_matrix = np.vstack((P_first_row, P_second_row))
+        slack_P_matrix = sparse.block_diag(
+            (P_matrix, sparse.csc_matrix((slack_n, slack_n))), format='csc')
 
         # record original matrix
         self.matrix_dict = {'P': P_matrix, 'Q': Q_matrix, 'A': A_matrix,
@@ -157,20 +131,94 @@ class path_opti:
 
         return slack_P_matrix, slack_Q_matrix, slack_A_matrix, slack_B_matrix, slack_G_matrix, slack_H_matrix
 
-    def get_result(self, path) -> List[List]:
+    def stack_curvature_constraint(self, reference_path: np.array = None):
+        '''
+        description: linearize the curvature constraint around the reference path
+                     and stack it below the collision constraints
+        param {np.array} reference_path: [[x,y],...], default is the original path
+        return {*} G, H, slack G, slack H
+        '''
+        points_n = len(self.original_path)
+        slack_n = max(points_n-2, 0)
+        G_matrix_curv, H_matrix_curv = self.compute_curvature_H(reference_path)
+        # each curvature constraint is relaxed by its own slack variable, so
+        # the slack block is diagonal and the nonzeros grow linearly with n
+        slack_G_matrix_curv = sparse.hstack(
+            (G_matrix_curv, -sparse.identity(slack_n, format='csc')))
+        slack_H_matrix_curv = H_matrix_curv
+        collision = self.collision_matrix_dict
+        G_matrix = sparse.vstack(
+            (collision['G'], G_matrix_curv), format='csc')
+        H_matrix = np.vstack((collision['H'], H_matrix_curv))
+        slack_G_matrix = sparse.vstack(
+            (collision['slack_G'], slack_G_matrix_curv), format='csc')
+        slack_H_matrix = np.vstack(
+            (collision['slack_H'], slack_H_matrix_curv))
+        return G_matrix, H_matrix, slack_G_matrix, slack_H_matrix
+
+    def relinearize(self, reference_path: np.array):
+        '''
+        description: update G and H of the last formated qp problem with the
+                     curvature constraint linearized around the reference path,
+                     P, Q, A and B are reused
+        param {np.array} reference_path: [[x,y],...]
+        return {*} the same as formate_matrix
+        '''
+        G_matrix, H_matrix, slack_G_matrix, slack_H_matrix = \
+            self.stack_curvature_constraint(reference_path)
+        self.matrix_dict['G'], self.matrix_dict['H'] = G_matrix, H_matrix
+        self.slack_matrix_dict['G'], self.slack_matrix_dict['H'] = slack_G_matrix, slack_H_matrix
+        m = self.slack_matrix_dict
+        return m['P'], m['Q'], m['A'], m['B'], m['G'], m['H']
+
+    def solve_qp(self, P, Q, A, B, G, H, warm_start: dict = None) -> dict:
+        '''
+        description: solve the qp by the backend, the qp is solved again by
+        cvxopt if the backend stops without convergence, e.g. admm reaches max_iter
+        return {dict} the qp result of qp_solver_base.solve
+        '''
+        QP_result = self.qp_solver.solve(P, Q, A, B, G, H, warm_start=warm_start)
+        profiler.count('qp_iterations', QP_result['iterations'])
+        if QP_result['status'] != 'optimal' and not isinstance(self.qp_solver, cvxopt_solver):
+            profiler.count('qp_fallbacks')
+            if self.fallback_solver is None:
+                self.fallback_solver = cvxopt_solver()
+            QP_result = self.fallback_solver.solve(P, Q, A, B, G, H)
+            profiler.count('qp_iterations', QP_result['iterations'])
+        if QP_result['status'] != 'optimal':
+            profiler.count('qp_failures')
+            self.last_success = False
+        return QP_result
+
+    def get_result(self, path, warm_start: dict = None) -> Tuple[Trajectory, bool]:
+        '''
+        description: smooth the path
+        param {*} path: Trajectory or [[x,y,theta],...]
+        param {dict} warm_start: the qp result of a previous solve of this path,
+                                 e.g. self.qp_result when the path is replanned
+        return {*} the optimized path and the path is forward or not,
+                   self.last_success is False if a qp did not converge
+        '''
+        self.last_success = True
         P, Q, A, B, G, H = self.formate_matrix(path)
-        P = matrix(P)
-        Q = matrix(Q)
-        A = matrix(A)
-        B = matrix(B)
-        G = matrix(G)
-        H = matrix(H)
-        solvers.options['maxiters'] = 100
-        QP_result = solvers.qp(P, Q, G, H, A, B)
-        result_path = QP_result['x']
+        QP_result = self.solve_qp(P, Q, A, B, G, H, warm_start=warm_start)
         points_n = len(self.original_path)
+
+        # sqp: linearize the curvature constraint around the last solution
+        # until the path does not change, sqp_max_iter = 1 means the
+        # constraint is only linearized around the hybrid a star path
+        for _ in range(self.config.get('sqp_max_iter', 1) - 1):
+            last_path = QP_result['x'][:2*points_n]
+            P, Q, A, B, G, H = self.relinearize(last_path.reshape(points_n, 2))
+            QP_result = self.solve_qp(P, Q, A, B, G, H, warm_start=QP_result)
+            profiler.count('sqp_iterations')
+            step = np.max(np.abs(QP_result['x'][:2*points_n] - last_path))
+            if step < self.config.get('sqp_tolerance', 1e-3):
+                break
+
+        self.qp_result = QP_result
+        result_path = QP_result['x']
         result_path = result_path[:2*points_n]
-        opti_path = []
 
         # check this short path is forward or not
         theta_forward_1 = self.original_path[0][2] > - \
@@ -182,39 +230,16 @@ class path_opti:
         forward = True if (self.original_path[0][0] < self.original_path[1][0] and theta_forward_1) or \
             (self.original_path[0][0] > self.original_path[1][0] and theta_forward_2) else False
 
-        # update theta
-        for i in range(int(len(result_path)/2)):
-            # update theta
-            if i == 0:
-                # initial theta
-                theta = self.original_path[0][2]
-            elif i == int(len(result_path)/2) - 1:
-                # final pose theta
-                theta = self.original_path[-1][2]
-            else:
-                if forward:
-                    vector_i = (result_path[2*(i+1)] - result_path[2*(i-1)],
-                                result_path[2*(i+1)+1] - result_path[2*(i-1)+1])
-                else:
-                    vector_i = (result_path[2*(i-1)] - result_path[2*(i+1)],
-                                result_path[2*(i-1)+1] - result_path[2*(i+1)+1])
-
-                vector_x = (1, 0)
-                # get cosine value, if the angle is biger than pi/2 the value is negative
-                cosine = 1 - spatial.distance.cosine(vector_i, vector_x)
-                tan_value = vector_i[1] / vector_i[0]
-                # return is [-pi/2, pi/2]
-                theta = math.atan(vector_i[1] / vector_i[0])
-
-                if cosine < 0:
-                    if tan_value > 0:
-                        theta -= math.pi
-                    else:
-                        theta += math.pi
-
-            point = [result_path[2*i], result_path[2*i+1],
-                     theta]
-            opti_path.append(point)
+        # update theta by the direction from the previous point to the next
+        # point, the initial theta and the final theta are not changed
+        opti_path = Trajectory.empty(points_n, PATH_COLUMNS)
+        opti_path.data[:, :2] = result_path.reshape(points_n, 2)
+        position = opti_path.data[:, :2]
+        vector = (position[2:] - position[:-2]) * (1 if forward else -1)
+        theta = opti_path.column('theta')
+        theta[1:-1] = np.arctan2(vector[:, 1], vector[:, 0])
+        theta[0] = self.original_path[0][2]
+        theta[-1] = self.original_path[-1][2]
 
         return opti_path, forward
 
@@ -222,448 +247,28 @@ class path_opti:
         '''
         use AABB block to find those map points near the vehicle
         and then find the shortest distance from these points to 
-        the vehicle square. noted as [f_d, b_d, r_d, l_d]
-        f_d is the shortest distance from obstacles to the front edge
-        b_d is to the rear edge, and r_d is to the right edge, l_d is 
-        to the left edge.
+        the vehicle square, see optimization/corridor.py
         [E;-E] X <= [H_max;-H_min]
         '''
-        v = self.vehicle
-
-        # get near obstacles and vehicle
-
-        def get_near_obstacles(node_x, node_y, theta, map: Map, config):
-            '''
-            this function is only used for distance check method
-            return the obstacles x and y, vehicle boundary
-            Note: vehicle boundary is expanded
-            '''
-
-            # create_polygon
-            vehicle_boundary = v.create_anticlockpoint(
-                x=node_x, y=node_y, theta=theta, config=config)
-
-            '''
-            right_rear = vehicle_boundary[0]
-            right_front = vehicle_boundary[1]
-            left_front = vehicle_boundary[2]
-            left_rear = vehicle_boundary[3]
-            note: these points have expanded
-            '''
-
-            # create AABB squaref
-            x_max = max(vehicle_boundary[:, 0]) + self.expand_dis
-            x_min = min(vehicle_boundary[:, 0]) - self.expand_dis
-            y_max = max(vehicle_boundary[:, 1]) + self.expand_dis
-            y_min = min(vehicle_boundary[:, 1]) - self.expand_dis
-
-            # get obstacle position
-            obstacle_index = np.where(map.cost_map == 255)
-            obstacle_position_x = map.map_position[0][obstacle_index[0]]
-            obstacle_position_y = map.map_position[1][obstacle_index[1]]
-
-            # find those obstacles point in the AABB square
-            near_x_position = obstacle_position_x[np.where(
-                (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-            near_y_position = obstacle_position_y[np.where(
-                (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-
-            # determine y
-            near_obstacle_x = near_x_position[np.where(
-                (near_y_position >= y_min) & (near_y_position <= y_max))]
-            near_obstacle_y = near_y_position[np.where(
-                (near_y_position >= y_min) & (near_y_position <= y_max))]
-
-            near_obstacle_range = [near_obstacle_x, near_obstacle_y]
-
-            return near_obstacle_range, vehicle_boundary
-
-        # compute the parameters of boundary line
-        def compute_k_b(point_1, point_2):
-            # k = (y_2 - y_1) / (x_2 - x_1)
-            k = (point_2[1] - point_1[1]) / (point_2[0] - point_1[0])
-            # b = y_1 - k * x_1
-            b = point_1[1] - k * point_1[0]
-            return k, b
-
-        def get_area_boundary(point1, point2):
-            area_x_min = min(point1[0], point2[0])
-            area_x_max = max(point1[0], point2[0])
-            area_y_min = min(point1[1], point2[1])
-            area_y_max = max(point1[1], point2[1])
-            return [area_x_min, area_x_max, area_y_min, area_y_max]
-
-        def compute_distance(_k, _b, point):
-            dis = abs(_k * point[0] + _b - point[1]) / np.sqrt(1+pow(_k, 2))
-            return dis
-
-        # compute the distance from the point to the line
-        def compute_hori_ver_dis(point, k, b, theta):
-            shortest_dis = compute_distance(_k=k, _b=b, point=point)
-            vertical_dis = shortest_dis / abs(np.cos(theta))
-            horizon_dis = shortest_dis / abs(np.sin(theta))
-            return float(horizon_dis), float(vertical_dis)
-
-        H_max = []
-        H_min = []
         points_n = len(self.original_path)
-        # create AABB boundary and get the near obstacles position
-        for p in self.original_path:
-            x, y, theta = p[0], p[1], p[2]
-            near_obstacles_range, vehicle_boundary = get_near_obstacles(node_x=x, node_y=y,
-                                                                        theta=theta, map=self.map, config=self.config)
-            # compute k and b
-            '''
-            0: right line
-            1: front line
-            2: left line
-            3: rear line
-            '''
-            line_k = []
-            line_b = []
-            for i in range(4):
-                if i < 3:
-                    k_i, b_i = compute_k_b(
-                        vehicle_boundary[i], vehicle_boundary[i+1])
-                    line_k.append(k_i)
-                    line_b.append(b_i)
-                else:
-                    k_i, b_i = compute_k_b(
-                        vehicle_boundary[i], vehicle_boundary[0])
-                    line_k.append(k_i)
-                    line_b.append(b_i)
-
-            near_obstacle_x = near_obstacles_range[0]
-            near_obstacle_y = near_obstacles_range[1]
-
-            # compute the obstacles points in which area
-            # there are four situations about the car heading
-            if theta >= -math.pi and theta < -math.pi / 2:
-                case = 3
-            elif theta >= -math.pi/2 and theta < 0:
-                case = 4
-            elif theta >= 0 and theta < math.pi / 2:
-                case = 1
-            elif theta >= math.pi/2 and theta <= math.pi:
-                case = 2
-
-            x_min, x_max = self.expand_dis, self.expand_dis
-            y_min, y_max = self.expand_dis, self.expand_dis
-            # compute each the boundary of each area
-            each_area_boundary = []
-            '''
-            right area --- 0
-            front area --- 1
-            left area --- 2
-            rear area --- 3
-            '''
-            for i in range(4):
-                if i < 3:
-                    _area = get_area_boundary(
-                        vehicle_boundary[i], vehicle_boundary[i+1])
-                else:
-                    _area = get_area_boundary(
-                        vehicle_boundary[i], vehicle_boundary[0])
-
-                each_area_boundary.append(_area)
-
-            # total 4 cases and four areas in each case to compute x,y boundary
-            # theta is in [0, pi/2)
-            if case == 1:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        k += 1
-            # theta is in [pi/2, pi]
-            elif case == 2:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        k += 1
-            # theta is in [-pi, -pi/2)
-            elif case == 3:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        k += 1
-            # theta is in [-pi/2, 0)
-            elif case == 4:
-                for obs_x, obs_y in zip(near_obstacle_x, near_obstacle_y):
-                    k = 0
-                    for area in each_area_boundary:
-                        '''
-                        k = 0: right line
-                        k = 1: front line
-                        k = 2: left line
-                        k = 3: rear line
-                        '''
-                        if k == 0:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 1:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2] - self.expand_dis
-                            obs_y_max = area[3]
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_min:
-                                    y_min = ver_dis
-                                break
-
-                        if k == 2:
-                            obs_x_min = area[0]
-                            obs_x_max = area[1] + self.expand_dis
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_max:
-                                    x_max = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        if k == 3:
-                            obs_x_min = area[0] - self.expand_dis
-                            obs_x_max = area[1]
-                            obs_y_min = area[2]
-                            obs_y_max = area[3] + self.expand_dis
-                            if obs_x > obs_x_min and obs_x < obs_x_max and obs_y > obs_y_min and obs_y < obs_y_max:
-                                hori_dis, ver_dis = compute_hori_ver_dis(
-                                    (obs_x, obs_y), line_k[k], line_b[k], theta)
-                                if hori_dis < x_min:
-                                    x_min = hori_dis
-                                if ver_dis < y_max:
-                                    y_max = ver_dis
-                                break
-
-                        k += 1
-
-            H_max.append(x_max+x)
-            H_max.append(y_max+y)
-            H_min.append(x-x_min)
-            H_min.append(y-y_min)
-
-        H_max_matrix = np.array(H_max).reshape(len(H_max), 1)
-        H_min_matrix = np.array(H_min).reshape(len(H_min), 1)
+        x_max, y_max, x_min, y_min = corridor.compute_bound(
+            self.original_path, self.map, self.vehicle, self.config, self.expand_dis)
+        H_max_matrix = np.column_stack((x_max, y_max)).reshape(2*points_n, 1)
+        H_min_matrix = np.column_stack((x_min, y_min)).reshape(2*points_n, 1)
         H_collision_matrix = np.vstack((H_max_matrix, -H_min_matrix))
         slack_H_collision_matrix = np.vstack((H_max_matrix, 999*np.ones((points_n-2, 1)),
                                               -H_min_matrix, np.zeros((points_n-2, 1))))
 
         return H_collision_matrix, slack_H_collision_matrix
 
-    def compute_curvature_H(self):
+    def compute_curvature_H(self, reference_path: np.array = None):
         '''
         We consider the curvature limits, and the final formate is 
         F'(X^r) \dot X <= F'(X^r) \dot X^r -F(X^r). We firstly use the 
         positions of continuous three points to get the equation with 
         the curvature and then use Taylor expansion to formate it as the 
         above fomulation.
+        X^r is the original path if the reference path ([[x,y],...]) is None.
         '''
         # formate F(X^r), X^r is the orginal points
         points_n = len(self.original_path)
@@ -671,7 +276,9 @@ class path_opti:
         # m, which equals to STEP_SIZE in rs_curve also equals to max_v * ddt (2.5m/s * 0.05s)
         delta_s = 0.125
 
-        points_r = np.array(self.original_path)
+        if reference_path is None:
+            reference_path = self.original_path
+        points_r = np.asarray(reference_path)
         points_r_x, points_r_y = points_r[:, 0], points_r[:, 1]
         F_xr = (points_r_x[2:] - 2*points_r_x[1:-1] + points_r_x[:-2])**2 + \
                (points_r_y[2:] - 2*points_r_y[1:-1] + points_r_y[:-2]
@@ -680,28 +287,17 @@ class path_opti:
 
         x_r = points_r[:, 0:2].flatten()
         x_r = x_r.reshape((2*points_n, 1))
-        eye_2 = np.eye(2)
-        row_eye = np.hstack((eye_2, -2*eye_2, eye_2))
-        constant_matrix = np.vstack((row_eye, -2*row_eye, row_eye))
-        F_pie_xr = np.zeros((1, 2*points_n))
-        # compute derive
-        for i in range(points_n-2):
-            i = i+1
-            first_row_1 = np.zeros((2*i-2, 2*i-2))
-            first_row_2 = np.zeros((2*i-2, 2*points_n-2*i+2))
-            first_row = np.hstack((first_row_1, first_row_2))
-            second_row = np.hstack((np.zeros((6, 2*i-2)),
-                                    constant_matrix,
-                                    np.zeros((6, 2*points_n-2*i-4))))
-            third_row = np.hstack((np.zeros((2*points_n-2*i-4, 2*i+4)),
-                                   np.zeros((2*points_n-2*i-4, 2*points_n-2*i-4))))
-            Q_i = np.vstack((first_row, second_row, third_row))
-            F_pie_xr_i = np.dot(x_r.transpose(), Q_i)
-            F_pie_xr = np.vstack((F_pie_xr, F_pie_xr_i))
-
-        F_pie_xr = F_pie_xr[1:]
+        # compute derive, row i is (D_i X^r)^T D_i, D_i is the second order
+        # difference of the point i, i+1, i+2
+        difference = self.difference_matrix(points_n, order=2)
+        difference_xr = (difference @ x_r).flatten()
+        row_index = np.repeat(np.arange(points_n-2), 2)
+        col_index = np.arange(2*(points_n-2))
+        difference_block = sparse.csc_matrix((difference_xr, (row_index, col_index)),
+                                             shape=(points_n-2, 2*(points_n-2)))
+        F_pie_xr = (difference_block @ difference).tocsc()
 
         G_matrix = F_pie_xr
-        H_matrix = np.dot(F_pie_xr, x_r) - F_xr
+        H_matrix = F_pie_xr @ x_r - F_xr
 
         return G_matrix, H_matrix
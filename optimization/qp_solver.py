@@ -0,0 +1,209 @@
+'''
+FilePath: /Automated Valet Parking/optimization/qp_solver.py
+Description: QP solver backends for the path optimization
+
+QP form: 1/2 X^T P X + Q^T X
+subject to: GX <= H
+            AX = B
+'''
+
+
+from abc import ABC, abstractmethod
+from typing import Dict
+import hashlib
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import splu
+
+
+class qp_solver_base(ABC):
+    def __init__(self) -> None:
+        super().__init__()
+
+    @abstractmethod
+    def solve(self, P, Q, A, B, G, H, warm_start: Dict = None) -> Dict:
+        '''
+        description: solve the QP problem
+        param P, A, G: scipy sparse matrices
+        param Q, B, H: column vectors
+        param {Dict} warm_start: the result of a previous solve with the same size
+        return {Dict} x: primal solution, y: dual of AX = B, z: dual of GX <= H,
+                      iterations, status
+        '''
+        pass
+
+
+def to_spmatrix(sparse_matrix):
+    '''
+    convert a scipy sparse matrix into a cvxopt spmatrix
+    '''
+    from cvxopt import spmatrix
+    coo_matrix = sparse_matrix.tocoo()
+    return spmatrix(coo_matrix.data.tolist(), coo_matrix.row.tolist(),
+                    coo_matrix.col.tolist(), size=coo_matrix.shape)
+
+
+class cvxopt_solver(qp_solver_base):
+    '''
+    interior point method of cvxopt, the warm start point is pushed into
+    the interior of the cone since cvxopt requires s > 0 and z > 0
+    '''
+
+    def __init__(self, max_iter: int = 100, interior_margin: float = 1e-6) -> None:
+        super().__init__()
+        self.max_iter = max_iter
+        self.interior_margin = interior_margin
+
+    def solve(self, P, Q, A, B, G, H, warm_start: Dict = None) -> Dict:
+        # import cvxopt only when the path is optimized
+        from cvxopt import matrix, solvers
+        solvers.options['maxiters'] = self.max_iter
+        initvals = None
+        if warm_start is not None and len(warm_start['x']) == P.shape[0]:
+            x = np.asarray(warm_start['x'], dtype=np.float64)
+            slack = np.asarray(H, dtype=np.float64).flatten() - G @ x
+            initvals = {'x': matrix(x),
+                        's': matrix(np.maximum(slack, self.interior_margin)),
+                        'y': matrix(np.asarray(warm_start['y'], dtype=np.float64)),
+                        'z': matrix(np.maximum(warm_start['z'], self.interior_margin))}
+        QP_result = solvers.qp(to_spmatrix(P), matrix(Q), to_spmatrix(G), matrix(H),
+                               to_spmatrix(A), matrix(B), initvals=initvals)
+        return {'x': np.array(QP_result['x']).flatten(),
+                'y': np.array(QP_result['y']).flatten(),
+                'z': np.array(QP_result['z']).flatten(),
+                'iterations': QP_result['iterations'],
+                'status': QP_result['status']}
+
+
+class admm_solver(qp_solver_base):
+    '''
+    sparse operator splitting (ADMM) solver in the form of OSQP:
+        min 1/2 x^T P x + q^T x  subject to l <= C x <= u
+    with C = [A; G], l = [B; -inf], u = [B; H].
+    the LU factorization of the KKT matrix is cached and reused while
+    P, C and rho do not change. the curvature rows of C depend on the
+    reference path, so the factorization is only reused when the same path
+    is solved again, e.g. a replan of the segment, not between segments or
+    sqp iterations. the solver stops with status 'max_iter' if the residuals
+    do not converge.
+    '''
+
+    def __init__(self,
+                 rho: float = 1.0,
+                 sigma: float = 1e-6,
+                 alpha: float = 1.6,
+                 eps_abs: float = 1e-4,
+                 eps_rel: float = 1e-4,
+                 max_iter: int = 4000,
+                 check_interval: int = 25) -> None:
+        super().__init__()
+        self.rho = rho
+        self.sigma = sigma
+        self.alpha = alpha
+        self.eps_abs = eps_abs
+        self.eps_rel = eps_rel
+        self.max_iter = max_iter
+        self.check_interval = check_interval
+        # cached factorization
+        self._matrix_key = None
+        self._rho_vector = None
+        self._factor = None
+
+    @staticmethod
+    def _hash_matrix(*matrices) -> str:
+        md5 = hashlib.md5()
+        for m in matrices:
+            md5.update(str(m.shape).encode())
+            md5.update(m.indptr.tobytes())
+            md5.update(m.indices.tobytes())
+            md5.update(m.data.tobytes())
+        return md5.hexdigest()
+
+    def _rho_of_rows(self, l: np.array, u: np.array) -> np.array:
+        # equality rows use a large rho, free rows a tiny one
+        rho_vector = self.rho * np.ones(len(l))
+        rho_vector[np.isinf(l) & np.isinf(u)] = 1e-6
+        rho_vector[np.abs(u - l) < 1e-8] = 1e3 * self.rho
+        return rho_vector
+
+    def _factorize(self, P, C, rho_vector):
+        n = P.shape[0]
+        kkt = sparse.bmat([[P + self.sigma * sparse.identity(n), C.transpose()],
+                           [C, -sparse.diags(1 / rho_vector)]], format='csc')
+        self._factor = splu(kkt)
+        self._rho_vector = rho_vector
+
+    def solve(self, P, Q, A, B, G, H, warm_start: Dict = None) -> Dict:
+        P = sparse.csc_matrix(P)
+        C = sparse.vstack((A, G), format='csc')
+        q = np.asarray(Q, dtype=np.float64).flatten()
+        B = np.asarray(B, dtype=np.float64).flatten()
+        H = np.asarray(H, dtype=np.float64).flatten()
+        l = np.hstack((B, -np.inf * np.ones(len(H))))
+        u = np.hstack((B, H))
+        n, m = P.shape[0], C.shape[0]
+        eq_n = A.shape[0]
+
+        # reuse the factorization if P, C and the row types do not change
+        rho_vector = self._rho_of_rows(l, u)
+        matrix_key = self._hash_matrix(P, C)
+        if self._factor is None or matrix_key != self._matrix_key or \
+                not np.array_equal(rho_vector, self._rho_vector):
+            self._factorize(P, C, rho_vector)
+            self._matrix_key = matrix_key
+        rho_vector = self._rho_vector
+
+        # warm start
+        if warm_start is not None and len(warm_start['x']) == n:
+            x = np.asarray(warm_start['x'], dtype=np.float64).copy()
+            y = np.hstack((warm_start['y'], warm_start['z'])).astype(np.float64)
+            z = np.clip(C @ x, l, u)
+        else:
+            x = np.zeros(n)
+            y = np.zeros(m)
+            z = np.zeros(m)
+
+        status = 'max_iter'
+        iterations = self.max_iter
+        for k in range(1, self.max_iter + 1):
+            rhs = np.hstack((self.sigma * x - q, z - y / rho_vector))
+            solution = self._factor.solve(rhs)
+            x_tilde = solution[:n]
+            z_tilde = z + (solution[n:] - y) / rho_vector
+            x = self.alpha * x_tilde + (1 - self.alpha) * x
+            z_relax = self.alpha * z_tilde + (1 - self.alpha) * z
+            z_new = np.clip(z_relax + y / rho_vector, l, u)
+            y = y + rho_vector * (z_relax - z_new)
+            z = z_new
+
+            if k % self.check_interval == 0:
+                Cx = C @ x
+                Px = P @ x
+                Cy = C.transpose() @ y
+                r_prim = np.linalg.norm(Cx - z, np.inf)
+                r_dual = np.linalg.norm(Px + q + Cy, np.inf)
+                eps_prim = self.eps_abs + self.eps_rel * \
+                    max(np.linalg.norm(Cx, np.inf), np.linalg.norm(z, np.inf))
+                eps_dual = self.eps_abs + self.eps_rel * \
+                    max(np.linalg.norm(Px, np.inf), np.linalg.norm(Cy, np.inf),
+                        np.linalg.norm(q, np.inf))
+                if r_prim <= eps_prim and r_dual <= eps_dual:
+                    status = 'optimal'
+                    iterations = k
+                    break
+
+        return {'x': x,
+                'y': y[:eq_n],
+                'z': y[eq_n:],
+                'iterations': iterations,
+                'status': status}
+
+
+def create_qp_solver(config: dict) -> qp_solver_base:
+    solver_type = config.get('qp_solver', 'cvxopt')
+    if solver_type == 'cvxopt':
+        return cvxopt_solver()
+    elif solver_type == 'admm':
+        return admm_solver()
+    else:
+        raise Exception("the qp solver type is not defined")
@@ -10,11 +10,11 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 '''
 
 
-from matplotlib.pyplot import grid
 import numpy as np
 import queue
 import math
 from map.costmap import Map
+from instrumentation.profiler import profiler
 
 
 class Grid:
@@ -202,6 +202,7 @@ class Dijkstra:
         Note:   closedlist contains the info(mainly distance) 
                 about those grid has been explored
         '''
+        profiler.count('dijkstra_calls')
         # initial map
         self.find_terminate = False
         current_grid = self.initial_map(node_x, node_y)
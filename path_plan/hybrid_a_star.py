@@ -16,7 +16,7 @@ from map.costmap import Map, Vehicle
 from collision_check import collision_check
 from path_plan.compute_h import Dijkstra
 from path_plan import rs_curve
-from animation.animation import *
+from instrumentation.profiler import profiler
 
 
 class Node:
@@ -87,8 +87,9 @@ class hybrid_a_star:
 
         # caculate heuristic and store h value
         self.heuristic = Dijkstra(park_map)
-        _, self.h_value_list = self.heuristic.compute_path(
-            node_x=park_map.case.x0, node_y=park_map.case.y0)
+        with profiler.timer('heuristic_build'):
+            _, self.h_value_list = self.heuristic.compute_path(
+                node_x=park_map.case.x0, node_y=park_map.case.y0)
 
         # default settings
         self.global_index = 0
@@ -127,6 +128,7 @@ class hybrid_a_star:
                     current_node: Node) -> queue.PriorityQueue:
         # caculate <x,y,theta> of the next node
         # next_index = 9 or 10(the first expansion)
+        profiler.count('expansions')
         child_group = queue.PriorityQueue()
         next_index = 0
         travle_distance = 0  # v_max * dt
@@ -262,6 +264,7 @@ class hybrid_a_star:
         '''
         We use Dijkstra algorithm and RS curve length to calculate the heuristic value 
         '''
+        profiler.count('heuristic_calls')
         # convert node to grid
         # grid_x = np.float64("%.1f" % (current_node.x + 0.05))
         # grid_y = np.float64("%.1f" % (current_node.y + 0.05))
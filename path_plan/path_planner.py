@@ -16,10 +16,10 @@ from scipy import spatial
 from typing import Dict, Tuple, List
 
 from path_plan.hybrid_a_star import hybrid_a_star
-from animation.animation import ploter
 from map.costmap import Vehicle, Map
 from collision_check import collision_check
 from path_plan.rs_curve import PATH
+from util_math.trajectory import Trajectory, PATH_COLUMNS
 
 
 class PathPlanner:
@@ -42,16 +42,22 @@ class PathPlanner:
         self.planner = hybrid_a_star(
             config=config, park_map=map, vehicle=vehicle)
 
-    def path_planning(self) -> Tuple[List[List], Dict, List[List[List]]]:
+    def path_planning(self) -> Tuple[Trajectory, Dict, List[Trajectory]]:
+        '''
+        return: the final path, the path info and the path split by the gear,
+        the paths are Trajectory of x,y,theta
+        '''
         final_path, astar_path, rs_path = self.a_star_plan()
         split_path_list, change_gear = self.split_path(final_path)
+        split_path_list = [Trajectory(path_i, PATH_COLUMNS)
+                           for path_i in split_path_list]
 
         path_info = {'astar_path': astar_path,
                      'rs_path': rs_path,
                      'change_gear': change_gear,
                      }
         # insert more points compared with final_path
-        out_final_path = sum(split_path_list, [])
+        out_final_path = Trajectory.concatenate(split_path_list, PATH_COLUMNS)
 
         return out_final_path, path_info, split_path_list
 
@@ -79,6 +85,8 @@ class PathPlanner:
 
             # plot the collision position
             if collision and self.config['draw_collision']:
+                # matplotlib is only imported if the collision is drawn
+                from animation.animation import ploter
                 collision_p = info['collision_position']
                 ploter.plot_collision_p(
                     collision_p[0], collision_p[1], collision_p[2], self.map)
@@ -12,7 +12,7 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 
 import math
 import numpy as np
-import matplotlib.pyplot as plt
+from instrumentation.profiler import profiler
 
 
 '''
@@ -27,6 +27,7 @@ PI = math.pi
 
 class Arrow:
     def __init__(self, x, y, theta, L, c):
+        import matplotlib.pyplot as plt
         angle = np.deg2rad(30)
         d = 0.5 * L
         w = 2
@@ -56,6 +57,7 @@ class Arrow:
 
 class Car:
     def __init__(self, x, y, yaw, w, L):
+        import matplotlib.pyplot as plt
         theta_B = PI + yaw
 
         xB = x + L / 4 * np.cos(theta_B)
@@ -97,6 +99,7 @@ class PATH:
 
 
 def calc_optimal_path(sx, sy, syaw, gx, gy, gyaw, maxc, step_size=STEP_SIZE):
+    profiler.count('rs_calls')
     paths = calc_all_paths(sx, sy, syaw, gx, gy, gyaw,
                            maxc, step_size=step_size)
 
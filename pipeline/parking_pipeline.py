@@ -0,0 +1,230 @@
+'''
+FilePath: /Automated Valet Parking/pipeline/parking_pipeline.py
+Description: the planning pipeline without any visualization, matplotlib
+             is never imported by this module
+
+Hybrid A star -> Path optimization -> Cubic interpolation -> Velocity plan -> OCP
+
+the segments split by the gear are optimized one after another, or by a
+process pool if parallel_segments is True
+'''
+
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+import os
+
+from path_plan import path_planner
+from map import costmap
+from velocity_plan import velocity_planner
+from interpolation import path_interpolation
+from optimization import path_optimazition, ocp_optimization
+from instrumentation.profiler import profiler
+from util_math.trajectory import Trajectory, PATH_COLUMNS
+
+
+class SegmentOptimizer:
+    '''
+    path optimization -> cubic fitting -> velocity plan -> interpolation -> ocp
+    of one segment, the segments only share their fixed endpoints
+    '''
+
+    def __init__(self,
+                 park_map: costmap.Map,
+                 vehicle: costmap.Vehicle,
+                 config: dict) -> None:
+        # create path optimizer
+        self.path_optimizer = path_optimazition.path_opti(
+            park_map, vehicle, config)
+
+        # create path interpolation
+        self.interplotor = path_interpolation.interpolation(
+            config=config, map=park_map, vehicle=vehicle)
+
+        # create velocity planner
+        self.v_planner = velocity_planner.VelocityPlanner(vehicle=vehicle,
+                                                          velocity_func_type=config['velocity_func_type'])
+
+        # create path optimization planner
+        self.ocp_planner = ocp_optimization.ocp_optimization(
+            park_map=park_map, vehicle=vehicle, config=config)
+
+    def solve(self, path_i: Trajectory) -> Dict:
+        '''
+        description: optimize one segment of the hybrid a star path
+        param {Trajectory} path_i: the segment, x,y,theta
+        return {Dict} opt_path, insert_path, ocp_path (t from the start of the segment),
+                      optimal_tf and optimal_dt of the segment, ocp_success:
+                      False if the ocp solver did not converge
+        '''
+        # optimize path
+        with profiler.timer('path_optimization'):
+            opti_path, forward = self.path_optimizer.get_result(path_i)
+
+        # cubic fitting
+        with profiler.timer('cubic_fitting'):
+            path_arc_length, path_i_info = self.interplotor.cubic_fitting(
+                opti_path)
+
+        # velocity planning
+        with profiler.timer('velocity_planning'):
+            v_acc_func, terminiate_time = self.v_planner.solve_nlp(
+                arc_length=path_arc_length)
+
+        # insert points
+        with profiler.timer('cubic_interpolation'):
+            insert_path = self.interplotor.cubic_interpolation(
+                path=opti_path, path_i_info=path_i_info, v_a_func=v_acc_func, forward=forward, terminate_t=terminiate_time, path_arc_length=path_arc_length,
+                s_func=self.v_planner.v_func.s_func)
+
+        # ocp problem solve
+        with profiler.timer('ocp_optimization'):
+            ocp_traj, optimal_ti, optimal_dt = self.ocp_planner.solution(
+                path=insert_path)
+
+        return {'opt_path': opti_path,
+                'insert_path': insert_path,
+                'ocp_path': ocp_traj,
+                'optimal_tf': optimal_ti,
+                'optimal_dt': optimal_dt,
+                'ocp_success': self.ocp_planner.last_success}
+
+
+# the segment optimizer of each worker process
+_worker_optimizer = None
+
+
+def _init_worker(park_map: costmap.Map, vehicle: costmap.Vehicle, config: dict):
+    global _worker_optimizer
+    _worker_optimizer = SegmentOptimizer(park_map, vehicle, config)
+
+
+def _solve_segment(path_i: Trajectory) -> Dict:
+    # the timings and counters of the worker are sent back with the result
+    profiler.reset()
+    result = _worker_optimizer.solve(path_i)
+    result['profile'] = profiler.record()
+    # the new ocp cache entries are saved by the main process
+    cache = _worker_optimizer.ocp_planner.cache
+    result['ocp_cache'] = cache.pop_new_entries() if cache is not None else {}
+    return result
+
+
+class ParkingPipeline:
+    def __init__(self,
+                 file: str,
+                 config: dict) -> None:
+        self.config = config
+
+        # create the park map
+        with profiler.timer('costmap'):
+            self.park_map = costmap.Map(
+                file=file, discrete_size=config['map_discrete_size'],
+                cache_path=config.get('case_cache_path', None) if config.get('case_cache', False) else None)
+
+        # create vehicle
+        self.vehicle = costmap.Vehicle()
+
+        # create path planner
+        with profiler.timer('planner_setup'):
+            self.planner = path_planner.PathPlanner(config=config,
+                                                    map=self.park_map,
+                                                    vehicle=self.vehicle)
+
+        # create the optimizer of the segments
+        self.segment_optimizer = SegmentOptimizer(
+            park_map=self.park_map, vehicle=self.vehicle, config=config)
+
+    def solve_parallel(self, split_path: List) -> List[Dict]:
+        '''
+        description: optimize the segments by a process pool, the results
+        are returned in the order of the segments
+        '''
+        workers = self.config.get('parallel_workers', 0) or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=min(workers, len(split_path)),
+                                 initializer=_init_worker,
+                                 initargs=(self.park_map, self.vehicle, self.config)) as executor:
+            results = list(executor.map(_solve_segment, split_path))
+        cache = self.segment_optimizer.ocp_planner.cache
+        for result in results:
+            profiler.merge(result.pop('profile'))
+            entries = result.pop('ocp_cache')
+            if cache is not None:
+                cache.merge(entries)
+        return results
+
+    def run(self) -> Dict:
+        '''
+        description: solve the parking case
+        return {Dict} the result of each stage:
+            original_path: hybrid a star path
+            split_path: the path split by the gear
+            opt_path: the optimized path
+            insert_path: the interpolation trajectory
+            ocp_path: the optimized trajectory, x,y,theta,v,a,sigma,omega,t
+            the paths are Trajectory, see util_math/trajectory.py
+            optimal_tf: the time of the optimized trajectory
+            pre_tf: the time of the interpolation trajectory
+            ocp_success: the ocp of each segment converged or not
+        '''
+        # path planning
+        optimal_tf = 0
+        pre_tf = 0
+        t = 0
+        optimal_time_info = []
+        with profiler.timer('path_planning'):
+            original_path, path_info, split_path = self.planner.path_planning()
+
+        # optimize the segments
+        with profiler.timer('segment_optimization'):
+            if self.config.get('parallel_segments', False) and len(split_path) > 1:
+                segment_results = self.solve_parallel(split_path)
+            else:
+                segment_results = [self.segment_optimizer.solve(path_i)
+                                   for path_i in split_path]
+
+        # the ocp cache is written once per run, not in the ocp stage
+        self.segment_optimizer.ocp_planner.save_cache()
+
+        # connect the segments in order
+        for segment in segment_results:
+            insert_path = segment['insert_path']
+            ocp_traj = segment['ocp_path']
+            optimal_ti = segment['optimal_tf']
+            optimal_dt = segment['optimal_dt']
+            pre_tf += insert_path['t'][-1]
+            optimal_time_info.append([optimal_ti, optimal_dt])
+            # add time information, the time of the segment continues
+            # after the last point of the previous segment
+            ocp_time = ocp_traj['t']
+            ocp_time += t + optimal_dt
+            t = ocp_time[-1]
+            optimal_tf += optimal_ti
+
+        # the segments are copied into one array at once
+        final_opt_path = Trajectory.concatenate(
+            [segment['opt_path'] for segment in segment_results], PATH_COLUMNS)
+        final_insert_path = Trajectory.concatenate(
+            [segment['insert_path'] for segment in segment_results])
+        final_ocp_path = Trajectory.concatenate(
+            [segment['ocp_path'] for segment in segment_results])
+
+        return {'original_path': original_path,
+                'split_path': split_path,
+                'opt_path': final_opt_path,
+                'insert_path': final_insert_path,
+                'ocp_path': final_ocp_path,
+                'optimal_tf': optimal_tf,
+                'pre_tf': pre_tf,
+                'optimal_time_info': optimal_time_info,
+                'ocp_success': [segment['ocp_success'] for segment in segment_results]}
+
+
+def plan(file: str, config: dict) -> Trajectory:
+    '''
+    description: headless planning api, solve the case and return the trajectory only
+    param {str} file: the benchmark case file
+    param {dict} config: the config dict, see config/read_config.py
+    return {Trajectory} the trajectory, x,y,theta,v,a,sigma,omega,t
+    '''
+    return ParkingPipeline(file=file, config=config).run()['ocp_path']
@@ -11,11 +11,39 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 
 
 
+from abc import ABC, abstractmethod
 from util_math.coordinate_transform import coordinate_transform
 import numpy as np
 import math
-from scipy.linalg import solve
-from scipy import integrate
+from scipy.linalg import solve, solve_banded
+
+
+class piecewise_curve(ABC):
+    '''
+    a curve of the path with one piece between each pair of points, the
+    parameter u of each piece is in [0, 1]
+    '''
+
+    def __init__(self, piece_num: int) -> None:
+        super().__init__()
+        self.piece_num = piece_num
+
+    @abstractmethod
+    def evaluate(self, index: np.array, u: np.array):
+        '''
+        description: evaluate the pieces in the original coordinate
+        param {np.array} index: the piece index of each sample
+        param {np.array} u: the parameter of each sample
+        return {*} x, y, the direction of the tangent (increasing u) and the curvature
+        '''
+        pass
+
+    @abstractmethod
+    def speed(self, index: np.array, u: np.array) -> np.array:
+        '''
+        return the norm of the derivative dP/du, the arc length is its integral
+        '''
+        pass
 
 
 class spine:
@@ -23,12 +51,12 @@ class spine:
         pass
 
     @staticmethod
-    def cubic_spline(start, end):
+    def cubic_coefficients(start, end):
         '''
-        description: note that after rotation tranformation, the new_end point is only in the quadrant 1 or 4
+        description: the cubic function y = ax^3+bx^2+cx+d in the coordinate of the start point
         param {*} start
         param {*} end
-        return {*} target cubic function,include [a,b,c,d]
+        return {*} [a,b,c,d], rotation matrix, new_end
         '''
         rotation_matrix, new_end = coordinate_transform.twodim_transform(
             start=start, end=end)
@@ -43,38 +71,137 @@ class spine:
         b = np.array([y0, y1, math.tan(theta0), math.tan(theta1)])
         result = solve(A, b)
 
-        def cubic_func(x):
-            a = result[0]
-            b = result[1]
-            c = result[2]
-            d = result[3]
-            y = a*x**3+b*x**2+c*x+d
-            y_pie = 3*a*x**2 + 2*b*x + c
-            slope_angle = math.atan(y_pie)  # [-pi/2, pi/2]
+        return result, rotation_matrix, new_end
 
-            return y, y_pie, slope_angle
+    @staticmethod
+    def end_tangent(point, chord) -> np.array:
+        '''
+        description: the unit tangent at the end point of a path, it is the
+        heading of the point, or the opposite if the vehicle moves backward
+        param {*} point: [x,y,theta]
+        param {*} chord: the vector from the first point to the second point of the end piece
+        '''
+        tangent = np.array([math.cos(point[2]), math.sin(point[2])])
+        if np.dot(tangent, chord) < 0:
+            tangent = -tangent
+        return tangent
 
-        return cubic_func, rotation_matrix, new_end
 
-    @staticmethod
-    def Simpson_integral(cubic_func,
-                         start_point: list,
-                         end_point: list) -> np.float64:
+class local_cubic_curve(piecewise_curve):
+    '''
+    the cubic functions of spine.cubic_coefficients, each pair of points is
+    connected by y = ax^3+bx^2+cx+d in the coordinate of the first point,
+    x = u * x1 where x1 is the x of the second point in this coordinate
+    '''
+
+    def __init__(self, path: list) -> None:
+        super().__init__(piece_num=len(path) - 1)
+        coefficients = []
+        rotation_matrix = []
+        x1 = []
+        for i in range(self.piece_num):
+            result, rotation_matrix_i, new_end = spine.cubic_coefficients(
+                start=path[i], end=path[i+1])
+            coefficients.append(result)
+            rotation_matrix.append(rotation_matrix_i)
+            x1.append(new_end[0])
+        self.coefficients = np.array(coefficients)  # [a,b,c,d] of each piece
+        self.rotation_matrix = np.array(rotation_matrix)
+        self.start = np.asarray(path)[:-1, :3]
+        self.x1 = np.array(x1)
+
+    def local_derivative(self, index: np.array, u: np.array):
+        '''
+        return x, y, y', y'' in the coordinate of the first point of the piece
+        '''
+        a, b, c, d = self.coefficients[index].transpose()
+        x = u * self.x1[index]
+        y = ((a * x + b) * x + c) * x + d
+        dy = (3 * a * x + 2 * b) * x + c
+        ddy = 6 * a * x + 2 * b
+        return x, y, dy, ddy
+
+    def evaluate(self, index: np.array, u: np.array):
+        x, y, dy, ddy = self.local_derivative(index, u)
+        direction = np.sign(self.x1[index])
+        # inverse transform into the original coordinate
+        rotation_matrix = self.rotation_matrix[index]
+        world_x = rotation_matrix[:, 0, 0] * x + rotation_matrix[:, 1, 0] * y + self.start[index, 0]
+        world_y = rotation_matrix[:, 0, 1] * x + rotation_matrix[:, 1, 1] * y + self.start[index, 1]
+        theta = np.arctan2(direction * dy, direction) + self.start[index, 2]
+        curvature = direction * ddy / (1 + dy ** 2) ** 1.5
+        return world_x, world_y, theta, curvature
+
+    def speed(self, index: np.array, u: np.array) -> np.array:
+        _, _, dy, _ = self.local_derivative(index, u)
+        return np.abs(self.x1[index]) * np.sqrt(1 + dy ** 2)
+
+
+class parametric_spline(piecewise_curve):
+    '''
+    one cubic spline x(l), y(l) of the whole path, the parameter l is the
+    chord length from the start point, so it is close to the arc length.
+    the second derivatives of the points are solved by one tridiagonal
+    system, the end condition is
+        natural: the second derivatives at both ends are zero
+        clamped: the tangents at both ends are the headings of the end points
+    '''
+
+    def __init__(self, path: list, boundary: str = 'clamped') -> None:
+        super().__init__(piece_num=len(path) - 1)
+        points = np.asarray(path)[:, :2]
+        # the chord length of each piece
+        h = np.maximum(np.hypot(*np.diff(points, axis=0).transpose()), 1e-6)
+        slope = np.diff(points, axis=0) / h[:, None]
+        n = self.piece_num
+
+        # the tridiagonal system of the second derivatives, in the banded form
+        banded = np.zeros((3, n + 1))
+        rhs = np.zeros((n + 1, 2))
+        banded[0, 2:] = h[1:]
+        banded[1, 1:-1] = 2 * (h[:-1] + h[1:])
+        banded[2, :-2] = h[:-1]
+        rhs[1:-1] = 6 * (slope[1:] - slope[:-1])
+        if boundary == 'clamped':
+            start_tangent = spine.end_tangent(path[0], points[1] - points[0])
+            end_tangent = spine.end_tangent(path[-1], points[-1] - points[-2])
+            banded[1, 0], banded[0, 1] = 2 * h[0], h[0]
+            banded[1, -1], banded[2, -2] = 2 * h[-1], h[-1]
+            rhs[0] = 6 * (slope[0] - start_tangent)
+            rhs[-1] = 6 * (end_tangent - slope[-1])
+        elif boundary == 'natural':
+            banded[1, 0] = banded[1, -1] = 1
+        else:
+            raise Exception("the spline boundary is not defined")
+        second_derivative = solve_banded((1, 1), banded, rhs)
+
+        # P(l) = a + b*l + c*l^2 + d*l^3 of each piece, l is in [0, h],
+        # the coefficients are stored as [a, b, c, d] of the shape (4, 2, piece_num)
+        m0, m1 = second_derivative[:-1], second_derivative[1:]
+        self.h = h
+        self.coefficients = np.stack((points[:-1],
+                                      slope - h[:, None] * (2 * m0 + m1) / 6,
+                                      m0 / 2,
+                                      (m1 - m0) / (6 * h[:, None]))).transpose(0, 2, 1).copy()
+
+    def derivative(self, index: np.array, u: np.array):
         '''
-        description: use simpson_integral to get the arc length of the optimized path
-        param: {function}: cubic function
-        param: {list} : the start point and the end point
-        return {*} the arc lenth
+        return P, dP/dl and d^2P/dl^2 of the samples, each is a (2, num) array
         '''
-        y = []
-        x_points = np.linspace(
-            start=start_point[0], stop=end_point[0], num=100)
-        for x in x_points:
-            _, y_pie, _ = cubic_func(x)
-            y_i = np.sqrt(1 + (y_pie)**2)
-            y.append(y_i)
-
-        y = np.array(y)
-        arc_length = integrate.simpson(y=y, x=x_points)
-
-        return abs(arc_length)
+        a, b, c, d = np.take(self.coefficients, index, axis=2)
+        l = u * np.take(self.h, index)
+        position = ((d * l + c) * l + b) * l + a
+        first = (3 * d * l + 2 * c) * l + b
+        second = 6 * d * l + 2 * c
+        return position, first, second
+
+    def evaluate(self, index: np.array, u: np.array):
+        position, first, second = self.derivative(index, u)
+        theta = np.arctan2(first[1], first[0])
+        curvature = (first[0] * second[1] - first[1] * second[0]) / \
+            np.hypot(first[0], first[1]) ** 3
+        return position[0], position[1], theta, curvature
+
+    def speed(self, index: np.array, u: np.array) -> np.array:
+        _, first, _ = self.derivative(index, u)
+        return np.take(self.h, index) * np.hypot(first[0], first[1])
@@ -0,0 +1,113 @@
+'''
+FilePath: /Automated Valet Parking/util_math/trajectory.py
+Description: the path and the trajectory shared by the stages of the pipeline
+
+the points are stored in one contiguous (N, k) float64 array, row i is the
+point i and the column names give the meaning of each column. the columns
+are returned as numpy views, so reading or writing a state does not copy
+the points, np.asarray(trajectory) returns the array itself.
+'''
+
+
+from typing import List
+import numpy as np
+
+
+# x,y,theta of the hybrid a star path and the optimized path
+PATH_COLUMNS = ('x', 'y', 'theta')
+# x,y,theta,v,a,sigma,omega,t of the interpolation and the ocp trajectory
+TRAJECTORY_COLUMNS = ('x', 'y', 'theta', 'v', 'a', 'sigma', 'omega', 't')
+
+
+class Trajectory:
+    def __init__(self, data=None, columns=TRAJECTORY_COLUMNS) -> None:
+        '''
+        description: the array is not copied if it is a contiguous float64 array
+        param {*} data: (N, k) array or [[x,y,theta,...],...], k is the number of columns
+        param {tuple} columns: the name of each column
+        '''
+        self.columns = tuple(columns)
+        if data is None:
+            data = np.zeros((0, len(self.columns)))
+        self.data = np.ascontiguousarray(data, dtype=np.float64)
+        if len(self.data) == 0:
+            self.data = self.data.reshape(0, len(self.columns))
+        if self.data.ndim != 2 or self.data.shape[1] != len(self.columns):
+            raise Exception("the columns of the trajectory are not defined")
+        self.index = {name: k for k, name in enumerate(self.columns)}
+
+    @staticmethod
+    def empty(points_n: int, columns=TRAJECTORY_COLUMNS):
+        '''
+        return a trajectory of points_n points filled with zeros
+        '''
+        return Trajectory(np.zeros((points_n, len(columns))), columns)
+
+    @staticmethod
+    def concatenate(trajectories: List, columns=TRAJECTORY_COLUMNS):
+        '''
+        description: connect the trajectories into one array at once
+        param {List} trajectories: the trajectories with the same columns
+        return {Trajectory}
+        '''
+        if len(trajectories) == 0:
+            return Trajectory(None, columns)
+        columns = as_trajectory(trajectories[0], columns).columns
+        return Trajectory(np.concatenate([np.asarray(traj)[:, :len(columns)]
+                                          for traj in trajectories]), columns)
+
+    def column(self, name: str) -> np.array:
+        '''
+        return the view of the column, e.g. trajectory.column('v')
+        '''
+        if name not in self.index:
+            raise Exception("the column " + name + " is not defined")
+        return self.data[:, self.index[name]]
+
+    def pose(self) -> np.array:
+        '''
+        return the view of [x,y,theta] of each point
+        '''
+        return self.data[:, :3]
+
+    def tolist(self) -> List[List]:
+        return self.data.tolist()
+
+    def copy(self):
+        return Trajectory(self.data.copy(), self.columns)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, key):
+        # trajectory['v'] is a column, the other keys index the array,
+        # e.g. trajectory[-1] is the last point
+        if isinstance(key, str):
+            return self.column(key)
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None and np.dtype(dtype) != self.data.dtype:
+            return self.data.astype(dtype)
+        if copy:
+            return self.data.copy()
+        return self.data
+
+    def __repr__(self) -> str:
+        return 'Trajectory(points=%d, columns=%s)' % (len(self), ','.join(self.columns))
+
+
+def as_trajectory(path, columns=TRAJECTORY_COLUMNS) -> Trajectory:
+    '''
+    description: the path is returned if it is a Trajectory, otherwise the
+    first len(columns) states of each point are converted to a Trajectory
+    param {*} path: Trajectory, (N, k) array or [[x,y,theta,...],...]
+    '''
+    if isinstance(path, Trajectory):
+        return path
+    if len(path) == 0:
+        return Trajectory(None, columns)
+    return Trajectory(np.asarray(path, dtype=np.float64)[:, :len(columns)], columns)
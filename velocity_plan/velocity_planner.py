@@ -16,6 +16,7 @@ from map.costmap import Vehicle
 import numpy as np
 from scipy.optimize import minimize
 from enum import Enum, unique
+from instrumentation.profiler import profiler
 
 e = 1e-10
 
@@ -28,9 +29,13 @@ class velocity_type(Enum):
 
 
 class velocity_func_base(ABC):
+    # the names of the optimization variables x and the initial x of SLSQP
+    param_names = []
+    x0 = None
+
     def __init__(self) -> None:
         super().__init__()
-        pass
+        self.tf = 0
 
     @abstractmethod
     def obj_func(x):
@@ -44,10 +49,28 @@ class velocity_func_base(ABC):
     def v_a_func():
         '''
         description: build the velocity and acceleration function
-        return {*} the velocity and the acceleration
+        param {*} t: a float or a numpy array of the time
+        return {*} the velocity and the acceleration, the same shape as t
+        '''
+        pass
+
+    @abstractmethod
+    def s_func():
+        '''
+        description: the analytic distance function, the integral of the velocity
+        param {*} t: a float or a numpy array of the time
+        return {*} the travel distance from time 0, the same shape as t
         '''
         pass
 
+    def optimal_param(self, max_v, max_a, arc_length):
+        '''
+        description: the analytic solution of the nlp problem
+        return {*} the optimal x, None if there is no analytic solution
+        and the nlp problem is solved by SLSQP
+        '''
+        return None
+
 
 class sin_func(velocity_func_base):
     '''
@@ -58,6 +81,8 @@ class sin_func(velocity_func_base):
         if t1 + pi / (2W) < t < t1 + pi / W: v(t) = Asin(W(t-t1))
     return {*} obj_func, constraint, x0
     '''
+    param_names = ['t1', 'A', 'W']
+    x0 = np.array((2.0, 0.5, 2.0))
 
     def __init__(self) -> None:
         super().__init__()
@@ -72,21 +97,55 @@ class sin_func(velocity_func_base):
         self.t0 = np.pi / (2 * w)
         self.tf = t1 + np.pi / w
 
+    def sin_time(self, t: np.array) -> np.array:
+        '''
+        the time of the sin part, t0 in the constant part and t-t1 after it
+        '''
+        return np.where(t < self.t0, t, np.maximum(t - self.t1, self.t0))
+
     def v_a_func(self, t):
         assert self.t1 != 0, 't1 should not be zero'
 
-        if t >= 0 and t < self.t0:
-            v = self.a * np.sin(self.w * t)
-            acc = self.a * self.w * np.cos(self.w * t)
-        elif t >= self.t0 and t < (self.t0 + self.t1):
-            v = self.a
-            acc = 0
-        elif t >= (self.t0 + self.t1) and t <= self.tf:
-            v = self.a * np.sin(self.w * (t-self.t1))
-            acc = self.a * self.w * np.cos(self.w * (t-self.t1))
+        t = np.asarray(t, dtype=np.float64)
+        sin_t = self.sin_time(t)
+        constant = (t >= self.t0) & (t < (self.t0 + self.t1))
+        v = np.where(constant, self.a, self.a * np.sin(self.w * sin_t))
+        acc = np.where(constant, 0, self.a * self.w * np.cos(self.w * sin_t))
 
+        if t.ndim == 0:
+            return float(v), float(acc)
         return v, acc
 
+    def s_func(self, t):
+        '''
+        if 0 < t < pi / (2W) : s(t) = A/W(1-cos(Wt))
+        if pi / (2W) < t < t1 + pi / (2W): s(t) = A/W + A(t-pi/(2W))
+        if t1 + pi / (2W) < t < t1 + pi / W: s(t) = A/W + At1 - A/Wcos(W(t-t1))
+        '''
+        t = np.asarray(t, dtype=np.float64)
+        s = self.a / self.w * (1 - np.cos(self.w * self.sin_time(t))) + \
+            self.a * (np.clip(t, self.t0, self.t0 + self.t1) - self.t0)
+
+        if t.ndim == 0:
+            return float(s)
+        return s
+
+    def optimal_param(self, max_v, max_a, arc_length):
+        '''
+        description: with t1 = s/A - 2/W the objective is s/A + (pi-2)/W,
+        so W = max_a/A and T(A) = s/A + (pi-2)A/max_a. T decreases until
+        A = sqrt(s*max_a/(pi-2)), which is larger than the A of t1 = 0,
+        so A is the smaller one of max_v and the A of t1 = e
+        return {*} x is a vecor: [t1,A,W]
+        '''
+        if not np.isfinite(arc_length) or arc_length <= 0:
+            return None
+        # A*e + 2A^2/max_a = s
+        a = min(max_v, (np.sqrt(e ** 2 + 8 * arc_length / max_a) - e) * max_a / 4)
+        w = max_a / a
+        t1 = max(arc_length / a - 2 / w, e)
+        return np.array((t1, a, w))
+
     def obj_func(self):
         '''
         description: the objective function
@@ -112,12 +171,228 @@ class sin_func(velocity_func_base):
         return cons
 
 
+class constant_func(velocity_func_base):
+    '''
+    description: trapezoidal velocity, the acceleration is constant
+        if 0 < t < ta : v(t) = A/ta * t
+        if ta < t < ta + t1: v(t) = A
+        if ta + t1 < t < 2ta + t1: v(t) = A - A/ta * (t-ta-t1)
+    '''
+    param_names = ['t1', 'A', 'ta']
+    x0 = np.array((2.0, 0.5, 1.0))
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.t1 = 0
+        self.a = 0
+        self.ta = 0
+
+    def initial_param(self, t1, a, ta):
+        self.t1 = t1
+        self.a = a
+        self.ta = ta
+        self.acc = a / ta
+        self.tf = t1 + 2 * ta
+
+    def phase_time(self, t: np.array):
+        '''
+        the time spent in the acceleration, constant and deceleration part
+        '''
+        return np.clip(t, 0, self.ta), np.clip(t - self.ta, 0, self.t1), \
+            np.clip(t - self.ta - self.t1, 0, self.ta)
+
+    def v_a_func(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        t_acc, _, t_dec = self.phase_time(t)
+        v = self.acc * (t_acc - t_dec)
+        acc = np.where(t < self.ta, self.acc,
+                       np.where((t >= self.ta + self.t1) & (t <= self.tf), -self.acc, 0))
+
+        if t.ndim == 0:
+            return float(v), float(acc)
+        return v, acc
+
+    def s_func(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        t_acc, t_const, t_dec = self.phase_time(t)
+        s = self.acc * t_acc ** 2 / 2 + self.a * (t_const + t_dec) - self.acc * t_dec ** 2 / 2
+
+        if t.ndim == 0:
+            return float(s)
+        return s
+
+    def optimal_param(self, max_v, max_a, arc_length):
+        '''
+        description: the acceleration is max_a, A is the smaller one of
+        max_v and the A of t1 = 0, i.e. A^2/max_a = s
+        return {*} x is a vecor: [t1,A,ta]
+        '''
+        if not np.isfinite(arc_length) or arc_length <= 0:
+            return None
+        a = min(max_v, np.sqrt(arc_length * max_a))
+        ta = a / max_a
+        t1 = max(arc_length / a - ta, 0)
+        return np.array((t1, a, ta))
+
+    def obj_func(self):
+        '''
+        description: the objective function
+        param {*} x is a vecor: [t1,A,ta]
+        return {*} obj_func
+        '''
+        return lambda x: x[0] + 2 * x[2]
+
+    def constraint(self, max_v, max_a, arc_length) -> Dict:
+        cons = ({"type": "ineq", "fun": lambda x: x[0]},  # t1 >= 0
+                {"type": "ineq", "fun": lambda x: x[1] - e},  # A > 0
+                {"type": "ineq", "fun": lambda x: x[2] - e},  # ta > 0
+                # v < max velocity
+                {"type": "ineq", "fun": lambda x: max_v - x[1]},
+                {"type": "ineq",
+                    "fun": lambda x: max_a - x[1] / x[2]},  # a < max acceleration
+                {"type": "eq", "fun": lambda x: arc_length -
+                    x[0]*x[1] - x[1]*x[2]},  # distance constraints
+                )
+
+        return cons
+
+
+class double_s_func(velocity_func_base):
+    '''
+    description: jerk limited velocity (double S), the acceleration part is
+        if 0 < t < tj : a(t) = J * t
+        if tj < t < ta - tj: a(t) = a_lim
+        if ta - tj < t < ta: a(t) = J * (ta - t)
+    with a_lim = V / (ta - tj), J = a_lim / tj, then the velocity is V
+    for tv and the deceleration part is symmetric to the acceleration part
+    '''
+    param_names = ['tj', 'ta', 'tv', 'V']
+    x0 = np.array((0.5, 2.0, 1.0, 0.5))
+
+    def __init__(self, max_jerk: float = 1.0) -> None:
+        super().__init__()
+        self.max_jerk = max_jerk
+        self.tj = 0
+        self.ta = 0
+        self.tv = 0
+        self.v = 0
+
+    def initial_param(self, tj, ta, tv, v):
+        self.tj = tj
+        self.ta = ta
+        self.tv = tv
+        self.v = v
+        self.a_lim = v / (ta - tj)
+        self.jerk = self.a_lim / tj
+        self.tf = 2 * ta + tv
+        self.distance = v * (ta + tv)
+
+    def acceleration_part(self, t: np.array):
+        '''
+        return the velocity, acceleration and distance of the acceleration part
+        '''
+        t = np.clip(t, 0, self.ta)
+        rest_t = self.ta - t
+        start = t < self.tj
+        end = rest_t < self.tj
+        v = np.where(start, self.jerk * t ** 2 / 2,
+                     np.where(end, self.v - self.jerk * rest_t ** 2 / 2,
+                              self.a_lim * (t - self.tj / 2)))
+        acc = np.where(start, self.jerk * t,
+                       np.where(end, self.jerk * rest_t, self.a_lim))
+        s = np.where(start, self.jerk * t ** 3 / 6,
+                     np.where(end, self.v * self.ta / 2 - self.v * rest_t + self.jerk * rest_t ** 3 / 6,
+                              self.a_lim / 6 * (3 * t ** 2 - 3 * self.tj * t + self.tj ** 2)))
+        return v, acc, s
+
+    def v_a_func(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        v_acc, a_acc, _ = self.acceleration_part(t)
+        v_dec, a_dec, _ = self.acceleration_part(self.tf - t)
+        acceleration = t < self.ta
+        deceleration = t > self.ta + self.tv
+        v = np.where(acceleration, v_acc, np.where(deceleration, v_dec, self.v))
+        acc = np.where(acceleration, a_acc, np.where(deceleration, -a_dec, 0))
+
+        if t.ndim == 0:
+            return float(v), float(acc)
+        return v, acc
+
+    def s_func(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        _, _, s_acc = self.acceleration_part(t)
+        _, _, s_dec = self.acceleration_part(self.tf - t)
+        s = np.where(t < self.ta, s_acc,
+                     np.where(t > self.ta + self.tv, self.distance - s_dec,
+                              self.v * self.ta / 2 + self.v * (t - self.ta)))
+
+        if t.ndim == 0:
+            return float(s)
+        return s
+
+    def optimal_param(self, max_v, max_a, arc_length):
+        '''
+        description: the acceleration part to V takes ta and the distance
+        V*ta/2, ta = a/J + V/a with a = max_a if V >= max_a^2/J, otherwise
+        ta = 2sqrt(V/J). V is max_v if V*ta <= s, otherwise V*ta = s
+        return {*} x is a vecor: [tj,ta,tv,V]
+        '''
+        if not np.isfinite(arc_length) or arc_length <= 0:
+            return None
+        jerk = self.max_jerk
+
+        def acceleration_time(v):
+            if v * jerk >= max_a ** 2:
+                return max_a / jerk, max_a / jerk + v / max_a
+            tj = np.sqrt(v / jerk)
+            return tj, 2 * tj
+
+        v = max_v
+        tj, ta = acceleration_time(v)
+        if v * ta > arc_length:
+            # V^2/max_a + V*max_a/J = s
+            v = (np.sqrt((max_a / jerk) ** 2 + 4 * arc_length / max_a) - max_a / jerk) * max_a / 2
+            if v * jerk < max_a ** 2:
+                # 2V*sqrt(V/J) = s
+                v = (arc_length * np.sqrt(jerk) / 2) ** (2 / 3)
+            tj, ta = acceleration_time(v)
+        tv = max(arc_length / v - ta, 0)
+        return np.array((tj, ta, tv, v))
+
+    def obj_func(self):
+        '''
+        description: the objective function
+        param {*} x is a vecor: [tj,ta,tv,V]
+        return {*} obj_func
+        '''
+        return lambda x: 2 * x[1] + x[2]
+
+    def constraint(self, max_v, max_a, arc_length) -> Dict:
+        max_jerk = self.max_jerk
+        cons = ({"type": "ineq", "fun": lambda x: x[0] - e},  # tj > 0
+                {"type": "ineq", "fun": lambda x: x[1] - 2 * x[0]},  # ta >= 2tj
+                {"type": "ineq", "fun": lambda x: x[2]},  # tv >= 0
+                {"type": "ineq", "fun": lambda x: x[3] - e},  # V > 0
+                # v < max velocity
+                {"type": "ineq", "fun": lambda x: max_v - x[3]},
+                {"type": "ineq",
+                    "fun": lambda x: max_a - x[3] / (x[1] - x[0])},  # a < max acceleration
+                {"type": "ineq",
+                    "fun": lambda x: max_jerk - x[3] / ((x[1] - x[0]) * x[0])},  # jerk < max jerk
+                {"type": "eq", "fun": lambda x: arc_length -
+                    x[3] * (x[1] + x[2])},  # distance constraints
+                )
+
+        return cons
+
+
 class VelocityPlanner:
     def __init__(self,
                  vehicle: Vehicle,
                  velocity_func_type: str = 'sin_func'):
         '''
-        description: the velocity function type is sin func
+        description: the velocity function type is sin_func, constant_func
+        (trapezoidal velocity) or double_s_func (jerk limited velocity)
         return {*} None
         '''
         self.vehicle = vehicle
@@ -126,6 +401,10 @@ class VelocityPlanner:
         self.plan_result = dict()
         if velocity_func_type == velocity_type.sin_func.name:
             self.v_func = sin_func()
+        elif velocity_func_type == velocity_type.constant_func.name:
+            self.v_func = constant_func()
+        elif velocity_func_type == velocity_type.double_s_func.name:
+            self.v_func = double_s_func(max_jerk=vehicle.max_jerk)
         else:
             raise Exception("the velocity function type is not defined")
 
@@ -133,31 +412,35 @@ class VelocityPlanner:
                   arc_length: np.float64 = None):
         '''
         description: solve a nlp problem to find the minimum travel time 
-        and the optimal velocity function
+        and the optimal velocity function, the analytic solution of the
+        velocity function is used if it exists, otherwise SLSQP
         return {*} the velocity function and the terminate time
         '''
 
         # def fun(x): return (x[0] + (x[1]*x[2])**2/2 *
         #                     x[0] + x[1]/4*x[2]**2*math.sin(2*x[1]*x[0]))
 
-        x0 = np.array((2.0, 0.5, 2.0))
+        # use the analytic solution if the velocity function has one
+        optimal_solve = self.v_func.optimal_param(max_v=self.max_v,
+                                                  max_a=self.max_acceleration,
+                                                  arc_length=arc_length)
+        if optimal_solve is None:
+            x0 = self.v_func.x0
 
-        obj_fun = self.v_func.obj_func()
-        cons = self.v_func.constraint(max_a=self.max_acceleration,
-                                      max_v=self.max_v,
-                                      arc_length=arc_length)
+            obj_fun = self.v_func.obj_func()
+            cons = self.v_func.constraint(max_a=self.max_acceleration,
+                                          max_v=self.max_v,
+                                          arc_length=arc_length)
 
-        result = minimize(fun=obj_fun, x0=x0, method="SLSQP", constraints=cons)
-        optimal_solve = result.x
-        t1 = optimal_solve[0]
-        a = optimal_solve[1]
-        w = optimal_solve[2]
+            result = minimize(fun=obj_fun, x0=x0, method="SLSQP", constraints=cons)
+            profiler.count('slsqp_iterations', result.nit)
+            optimal_solve = result.x
+        self.v_func.initial_param(*optimal_solve)
 
-        terminate_t = t1 + np.pi / w
+        terminate_t = self.v_func.tf
 
         print('terminate_time:', terminate_t)
 
-        self.plan_result = {"A": a, "W": w, "t1": t1}
-        self.v_func.initial_param(t1, a, w)
+        self.plan_result = dict(zip(self.v_func.param_names, optimal_solve))
 
         return self.v_func.v_a_func, terminate_t